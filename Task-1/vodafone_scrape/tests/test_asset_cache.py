@@ -0,0 +1,56 @@
+import asyncio
+import os
+
+from vodafone_scrape.asset_cache import AssetCache, freshness
+
+
+NOW = 1_700_000_000.0
+
+
+def test_freshness_from_max_age():
+    assert freshness({"cache-control": "public, max-age=600"}, NOW) == (True, NOW + 600)
+
+
+def test_immutable_expires_with_max_age():
+    assert freshness({"cache-control": "max-age=60, immutable"}, NOW) == (True, NOW + 60)
+
+
+def test_freshness_from_expires():
+    assert freshness({"expires": "Tue, 14 Nov 2023 23:13:20 GMT"}, NOW) == (True, NOW + 3600)
+
+
+def test_no_cache_is_stored_stale():
+    assert freshness({"cache-control": "no-cache", "etag": '"v1"'}, NOW) == (True, NOW)
+
+
+def test_no_store_and_private_are_not_stored():
+    assert not freshness({"cache-control": "no-store"}, NOW)[0]
+    assert not freshness({"cache-control": "private, max-age=600"}, NOW)[0]
+
+
+def test_without_headers_only_revalidatable_is_stored():
+    assert freshness({"last-modified": "Tue, 14 Nov 2023 22:03:20 GMT"}, NOW) == (True, NOW)
+    assert not freshness({}, NOW)[0]
+
+
+class Route:
+    async def fulfill(self, **kwargs):
+        self.fulfilled = kwargs
+
+
+def test_evict_drops_least_recently_used(tmp_path, crawler):
+    cache = AssetCache(str(tmp_path / "cache"), 10, crawler)
+    headers = {"cache-control": "max-age=600"}
+    cache.store("aa", "https://example.com/a.js", 200, headers, b"aaaa", NOW)
+    cache.store("bb", "https://example.com/b.js", 200, headers, b"bbbb", NOW + 1)
+    # Serving a.js makes b.js the least recently used
+    entry = cache.db.execute("SELECT * FROM assets WHERE key = 'aa'").fetchone()
+    asyncio.run(cache._serve(Route(), entry, b"aaaa"))
+
+    cache.store("cc", "https://example.com/c.js", 200, headers, b"cccc", NOW + 2)
+
+    keys = [row["key"] for row in cache.db.execute("SELECT key FROM assets ORDER BY key")]
+    assert keys == ["aa", "cc"]
+    assert not os.path.exists(cache._path("bb"))
+    assert crawler.stats.get_value("asset_cache/evicted") == 1
+    cache.close()
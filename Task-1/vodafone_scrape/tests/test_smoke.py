@@ -0,0 +1,21 @@
+from vodafone_scrape.spiders.vodafone_product import VodafoneProductSpider
+
+
+PRODUCT = "https://www.vodafone.co.uk/mobile/pay-monthly-contracts/apple/iphone-15"
+
+
+def test_start_requests(tmp_path, make_spider):
+    (tmp_path / "product_urls.csv").write_text(
+        f"url\n{PRODUCT}\n{PRODUCT}/?utm_source=mail\n"
+        "https://www.vodafone.co.uk/mobile/pay-monthly-contracts/apple/iphone-14\n",
+        encoding="utf-8",
+    )
+    spider = make_spider(VodafoneProductSpider, PRODUCT_LIMIT=0)
+
+    requests = list(spider.start_requests())
+
+    urls = list(dict.fromkeys(request.url for request in requests))
+    assert len(urls) == 2
+    assert all(request.priority == spider.scheduler.priority(request.url) > 0 for request in requests)
+    assert spider.crawler.stats.get_value("schedule/available") == 2
+    assert spider.crawler.stats.get_value("schedule/planned") == 2
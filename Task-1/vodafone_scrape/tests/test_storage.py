@@ -0,0 +1,51 @@
+import os
+import tarfile
+
+from vodafone_scrape.storage import ArchiveStore, load_regions
+
+
+def test_save_and_read_across_segments(tmp_path):
+    # Every save fills a segment, so each capture starts a new one
+    store = ArchiveStore(str(tmp_path), segment_bytes=1)
+    long_path = os.path.join("Product", "x" * 120 + ".png")  # needs a PAX header
+    store.save("Product/a.png", b"first", product="Product", step="pdp")
+    store.save(long_path, b"second" * 100, product="Product", step="msrp")
+    store.save("Product/a.png", b"third", product="Product", step="pdp")
+
+    assert store.read("Product/a.png") == b"third"
+    assert store.read(long_path) == b"second" * 100
+    assert [row["segment"] for row in store.query(product="Product")] == [
+        "captures-00003.tar", "captures-00002.tar", "captures-00001.tar",
+    ]
+    store.close()
+
+    # Segments stay plain tar files
+    with tarfile.open(tmp_path / "captures-00002.tar") as tar:
+        assert tar.extractfile(long_path.replace(os.sep, "/")).read() == b"second" * 100
+
+
+def test_numbering_continues_after_pruned_segments(tmp_path):
+    store = ArchiveStore(str(tmp_path), segment_bytes=1)
+    store.save("a.png", b"a")
+    store.save("b.png", b"b")
+    store.close()
+    os.remove(tmp_path / "captures-00001.tar")
+
+    store = ArchiveStore(str(tmp_path), segment_bytes=1)
+    assert store.save("c.png", b"c") == "captures-00003.tar:c.png"
+    assert store.read("b.png") == b"b"
+    store.close()
+
+
+def test_export_writes_latest_captures_and_regions(tmp_path):
+    store = ArchiveStore(str(tmp_path / "archive"), segment_bytes=1)
+    regions = [{"name": "chat", "x": 0, "y": 0, "width": 10, "height": 10}]
+    store.save("Product/a.png", b"old")
+    store.save("Product/a.png", b"new", regions=regions)
+    store.save("Product/b.png", b"b")
+
+    assert store.export(str(tmp_path / "out")) == 2
+    assert (tmp_path / "out" / "Product" / "a.png").read_bytes() == b"new"
+    assert (tmp_path / "out" / "Product" / "b.png").read_bytes() == b"b"
+    assert load_regions(str(tmp_path / "out" / "Product")) == {"a.png": {"regions": regions, "processed": False}}
+    store.close()
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from email.utils import parsedate_to_datetime
+
+
+# Hop-by-hop / encoding headers that no longer describe the decoded body we store
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+def freshness(headers, now):
+    """Return ``(store, expires)`` for a response from its cache headers.
+
+    ``immutable`` needs no handling: entries are only ever served without
+    revalidation while fresh, which is all it asks for.
+    """
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-store" in cache_control or "private" in cache_control:
+        return False, 0
+    if "no-cache" in cache_control:
+        return True, now
+
+    max_age = re.search(r"max-age=(\d+)", cache_control)
+    if max_age:
+        return True, now + int(max_age.group(1))
+    if headers.get("expires"):
+        try:
+            return True, parsedate_to_datetime(headers["expires"]).timestamp()
+        except (TypeError, ValueError):
+            return True, now
+    # No freshness info: keep it only if it can be revalidated
+    return bool(headers.get("etag") or headers.get("last-modified")), now
+
+
+class AssetCache:
+    """Disk-backed cache for static front-end assets, shared by contexts and runs.
+
+    Installed as a Playwright route on each page, it serves scripts, styles,
+    fonts and images from ``directory`` while they are fresh per their
+    Cache-Control / Expires headers, revalidates stale entries with their
+    ETag / Last-Modified, and evicts least recently used entries once the
+    cache grows past ``max_bytes``. Anything else falls through to the
+    regular scrapy-playwright route handler. Hits, misses and bytes saved are
+    counted under ``asset_cache/*`` in the crawler stats.
+    """
+
+    RESOURCE_TYPES = {"script", "stylesheet", "font", "image"}
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS assets (
+            key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            headers TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            expires REAL NOT NULL,
+            last_used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS assets_last_used ON assets (last_used);
+    """
+
+    def __init__(self, directory, max_bytes, crawler):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.crawler = crawler
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, "index.sqlite"))
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(self.SCHEMA)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """The configured cache, or None when ``ASSET_CACHE_ENABLED`` is off."""
+        settings = crawler.settings
+        if not settings.getbool("ASSET_CACHE_ENABLED", True):
+            return None
+        return cls(
+            settings.get("ASSET_CACHE_DIR", ".asset_cache"),
+            settings.getint("ASSET_CACHE_MAX_BYTES", 512 * 1024 * 1024),
+            crawler,
+        )
+
+    async def install(self, page):
+        await page.route("**/*", self.handle)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _read(self, entry):
+        try:
+            with open(self._path(entry["key"]), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    async def _serve(self, route, entry, body):
+        self.crawler.stats.inc_value("asset_cache/bytes_saved", len(body))
+        self.db.execute("UPDATE assets SET last_used = ? WHERE key = ?", (time.time(), entry["key"]))
+        self.db.commit()
+        await route.fulfill(status=entry["status"], headers=json.loads(entry["headers"]), body=body)
+
+    async def handle(self, route):
+        request = route.request
+        if request.method != "GET" or request.resource_type not in self.RESOURCE_TYPES:
+            await route.fallback()
+            return
+
+        key = hashlib.sha256(request.url.encode("utf-8")).hexdigest()
+        entry = self.db.execute("SELECT * FROM assets WHERE key = ?", (key,)).fetchone()
+        body = self._read(entry) if entry else None
+        now = time.time()
+
+        if body is not None and entry["expires"] > now:
+            self.crawler.stats.inc_value("asset_cache/hit")
+            await self._serve(route, entry, body)
+            return
+
+        headers = None
+        if body is not None:
+            headers = dict(request.headers)
+            if entry["etag"]:
+                headers["if-none-match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["if-modified-since"] = entry["last_modified"]
+
+        try:
+            response = await route.fetch(headers=headers)
+        except Exception:
+            await route.fallback()
+            return
+
+        if body is not None and response.status == 304:
+            _, expires = freshness(response.headers, now)
+            self.db.execute("UPDATE assets SET expires = ? WHERE key = ?", (expires, key))
+            self.crawler.stats.inc_value("asset_cache/revalidated")
+            await self._serve(route, entry, body)
+            return
+
+        self.crawler.stats.inc_value("asset_cache/miss")
+        body = await response.body()
+        response_headers = {k: v for k, v in response.headers.items() if k.lower() not in DROPPED_HEADERS}
+        if response.status == 200:
+            self.store(key, request.url, response.status, response_headers, body, now)
+        await route.fulfill(status=response.status, headers=response_headers, body=body)
+
+    def store(self, key, url, status, headers, body, now):
+        cacheable, expires = freshness(headers, now)
+        if not cacheable:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(body)
+        self.db.execute(
+            "INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, url, status, json.dumps(headers), len(body), headers.get("etag"),
+             headers.get("last-modified"), expires, now),
+        )
+        self.db.commit()
+        self.crawler.stats.inc_value("asset_cache/stored")
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in ``max_bytes``."""
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM assets").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in self.db.execute("SELECT key, size FROM assets ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(row["key"]))
+            except OSError:
+                pass
+            self.db.execute("DELETE FROM assets WHERE key = ?", (row["key"],))
+            total -= row["size"]
+            self.crawler.stats.inc_value("asset_cache/evicted")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,111 @@
+RUNNER_JS = """async (ops) => {
+    const refs = window.__batchRefs = window.__batchRefs || {};
+    const sleep = ms => new Promise(res => setTimeout(res, ms));
+    const matches = (el, text) => el.innerText.trim().toLowerCase() === text;
+    const contains = (el, text) => el.innerText.toLowerCase().includes(text);
+
+    const resolve = op => {
+        if (op.ref) {
+            const el = (refs[op.ref[0]] || [])[op.ref[1]];
+            if (el && el.isConnected) return el;
+        }
+        if (!op.selector) return null;
+        const els = Array.from(document.querySelectorAll(op.selector));
+        if (op.text != null) {
+            const text = op.text.trim().toLowerCase();
+            return els.find(el => matches(el, text)) || els.find(el => contains(el, text)) || null;
+        }
+        return els[op.index || 0] || null;
+    };
+
+    const results = {};
+    for (let i = 0; i < ops.length; i++) {
+        const op = ops[i];
+        let value = null;
+        switch (op.op) {
+            case "click": {
+                const el = resolve(op);
+                if (el) {
+                    el.scrollIntoView({ block: "center" });
+                    el.click();
+                }
+                value = !!el;
+                break;
+            }
+            case "exists":
+                value = !!resolve(op);
+                break;
+            case "texts":
+            case "values": {
+                const els = Array.from(document.querySelectorAll(op.selector));
+                if (op.keep) refs[op.keep] = els;
+                value = els.map(el => op.op === "texts" ? el.innerText : el.value);
+                break;
+            }
+            case "wait":
+                await sleep(op.ms);
+                value = true;
+                break;
+            case "wait_for": {
+                const end = performance.now() + op.timeout;
+                while (!resolve(op) && performance.now() < end) await sleep(100);
+                value = !!resolve(op);
+                break;
+            }
+        }
+        if (op.name) results[op.name] = value;
+        if (op.required && !value) {
+            return { ok: false, failed: i, op: op.op, target: op.selector || op.ref, results };
+        }
+    }
+    return { ok: true, failed: null, results };
+}"""
+
+
+class BatchFailed(Exception):
+    """A ``required`` action in a batch found nothing to act on."""
+
+
+class ActionBatch:
+    """Compile a sequence of reads, clicks and checks into one in-page script.
+
+    Every action runs inside a single ``page.evaluate`` call, so a variant
+    switch or state probe costs one CDP round trip instead of one per call.
+    ``texts``/``values`` can ``keep`` the matched elements under a name; later
+    batches address them with ``ref=(name, index)`` and fall back to
+    ``selector`` (optionally matched by ``text``) once the element is gone,
+    e.g. after a navigation or re-render. Clicks are DOM clicks, like the
+    ``evaluate`` fallbacks they replace.
+    """
+
+    def __init__(self):
+        self.ops = []
+
+    def _add(self, op, **kwargs):
+        self.ops.append({"op": op, **{k: v for k, v in kwargs.items() if v is not None and v is not False}})
+        return self
+
+    def click(self, selector=None, ref=None, text=None, index=None, name=None, required=False):
+        return self._add("click", selector=selector, ref=ref, text=text, index=index, name=name, required=required)
+
+    def exists(self, selector, name, text=None):
+        return self._add("exists", selector=selector, text=text, name=name)
+
+    def texts(self, selector, name, keep=None):
+        return self._add("texts", selector=selector, name=name, keep=keep)
+
+    def values(self, selector, name, keep=None):
+        return self._add("values", selector=selector, name=name, keep=keep)
+
+    def wait(self, ms):
+        return self._add("wait", ms=ms)
+
+    def wait_for(self, selector, timeout, text=None, name=None, required=False):
+        return self._add("wait_for", selector=selector, text=text, timeout=timeout, name=name, required=required)
+
+    async def run(self, page):
+        """Run the batch in one round trip and return ``{name: result}``."""
+        outcome = await page.evaluate(RUNNER_JS, self.ops)
+        if not outcome["ok"]:
+            raise BatchFailed(f"{outcome['op']} found nothing for {outcome['target']} (action {outcome['failed'] + 1})")
+        return outcome["results"]
@@ -0,0 +1,81 @@
+import json
+
+
+def load_profiles(settings, selected=None):
+    """Return the ``{name: profile}`` locale profiles selected for this run.
+
+    ``selected`` is a comma separated list of names from ``LOCALE_PROFILES``,
+    ``"all"``, or the path of a JSON file holding the profiles themselves.
+    Falls back to the ``LOCALES`` setting; an empty selection means a single
+    run in the default context, exactly as before.
+    """
+    profiles = settings.getdict("LOCALE_PROFILES")
+    selected = selected or settings.get("LOCALES")
+    if not selected:
+        return {}
+
+    if isinstance(selected, str):
+        if selected.endswith(".json"):
+            with open(selected, "r", encoding="utf-8") as f:
+                return json.load(f)
+        selected = [name.strip() for name in selected.split(",") if name.strip()]
+
+    if list(selected) == ["all"]:
+        return profiles
+
+    missing = [name for name in selected if name not in profiles]
+    if missing:
+        raise ValueError(f"Unknown locale profile(s): {', '.join(missing)}")
+    return {name: profiles[name] for name in selected}
+
+
+def accept_language(profile):
+    language = profile.get("language")
+    if not language:
+        return None
+    primary = language.split("-")[0]
+    return f"{language},{primary};q=0.9" if primary != language else language
+
+
+def context_kwargs(profile, postcode_cookie=None, cookie_domain=None):
+    """Translate a locale profile into Playwright ``new_context`` kwargs."""
+    kwargs = {}
+    if profile.get("geolocation"):
+        kwargs["geolocation"] = profile["geolocation"]
+        kwargs["permissions"] = ["geolocation"]
+    if profile.get("timezone"):
+        kwargs["timezone_id"] = profile["timezone"]
+    if profile.get("language"):
+        kwargs["locale"] = profile["language"]
+        kwargs["extra_http_headers"] = {"Accept-Language": accept_language(profile)}
+    if profile.get("postcode") and postcode_cookie and cookie_domain:
+        kwargs["storage_state"] = {
+            "cookies": [{
+                "name": postcode_cookie,
+                "value": str(profile["postcode"]),
+                "domain": cookie_domain,
+                "path": "/",
+            }],
+            "origins": [],
+        }
+    return kwargs
+
+
+def request_meta(name, profile, settings):
+    """Request meta that sends a request through the profile's own browser context."""
+    return {
+        "playwright_context": f"locale-{name}",
+        "playwright_context_kwargs": context_kwargs(
+            profile,
+            postcode_cookie=settings.get("LOCALE_POSTCODE_COOKIE"),
+            cookie_domain=settings.get("LOCALE_COOKIE_DOMAIN"),
+        ),
+        "locale_region": name,
+    }
+
+
+def widen_concurrency(settings, count):
+    """Let one request per profile run at the same time in the shared browser."""
+    for key in ("CONCURRENT_REQUESTS", "CONCURRENT_REQUESTS_PER_DOMAIN"):
+        if settings.getint(key) < count:
+            settings.set(key, count, priority="spider")
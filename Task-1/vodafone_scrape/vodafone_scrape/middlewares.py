@@ -3,7 +3,14 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import json
+import os
+import time
+from urllib.parse import urlparse
+
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import TextResponse
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
@@ -98,3 +105,117 @@ class VodafoneScrapeDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class PlaywrightRoutingMiddleware:
+    """Fetch over plain HTTP first and escalate to Playwright only when needed.
+
+    Requests that hold on to the page (``playwright_include_page``) or set
+    ``playwright_required`` always use the browser; set the latter on any
+    request whose page methods do work plain HTTP can't (scrolling, clicks). Other ``playwright``
+    requests are sent through the normal Scrapy HTTP stack; if the response
+    fails the checks (bad status, bot challenge, missing ``routing_selectors``)
+    the request is re-issued through Playwright. The outcome is remembered
+    per URL pattern, with when it was made, so later requests skip the probe;
+    a "browser" decision older than ``reprobe_hours`` is probed again, so one
+    challenge page does not pin a pattern to Playwright for good.
+    """
+
+    def __init__(self, stats, challenge_markers, pattern_depth=1, decisions_file=None, reprobe_hours=24.0):
+        self.stats = stats
+        self.challenge_markers = [m.lower() for m in challenge_markers]
+        self.pattern_depth = pattern_depth
+        self.decisions_file = decisions_file
+        self.reprobe_hours = reprobe_hours
+        self.decisions = {}
+        if decisions_file and os.path.exists(decisions_file):
+            with open(decisions_file, "r", encoding="utf-8") as f:
+                self.decisions = json.load(f)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ROUTING_ENABLED", True):
+            raise NotConfigured
+        s = cls(
+            crawler.stats,
+            settings.getlist("ROUTING_CHALLENGE_MARKERS"),
+            pattern_depth=settings.getint("ROUTING_PATTERN_DEPTH", 1),
+            decisions_file=settings.get("ROUTING_DECISIONS_FILE"),
+            reprobe_hours=settings.getfloat("ROUTING_REPROBE_HOURS", 24.0),
+        )
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def url_pattern(self, url):
+        parsed = urlparse(url)
+        segments = parsed.path.strip("/").split("/")[:self.pattern_depth]
+        return f"{parsed.netloc}/{'/'.join(segments)}"
+
+    def process_request(self, request, spider):
+        meta = request.meta
+        if not meta.get("playwright") or meta.get("routing_route"):
+            return None
+        if meta.get("playwright_include_page") or meta.get("playwright_required"):
+            meta["routing_route"] = "browser"
+            return None
+
+        pattern = self.url_pattern(request.url)
+        decision = self.decisions.get(pattern)
+        if decision and decision["route"] == "browser":
+            if not self.reprobe_hours or time.time() - decision["decided"] < self.reprobe_hours * 3600:
+                meta["routing_route"] = "browser"
+                self.stats.inc_value("routing/browser")
+                return None
+            # Stale: the challenge or outage behind it may be gone, try plain HTTP again
+            del self.decisions[pattern]
+            decision = None
+
+        # Known static pattern, or an unknown one being probed
+        meta["routing_route"] = "http"
+        meta["playwright"] = False
+        self.stats.inc_value("routing/http" if decision else "routing/probe")
+        return None
+
+    def check(self, request, response):
+        """Return why a plain HTTP response is not good enough, or None."""
+        if response.status >= 400:
+            return "status"
+        if not isinstance(response, TextResponse):
+            return None
+        body = response.text.lower()
+        if any(marker in body for marker in self.challenge_markers):
+            return "challenge"
+        for selector in request.meta.get("routing_selectors", []):
+            if not response.css(selector):
+                return "selector"
+        return None
+
+    def escalate(self, request, reason, spider):
+        pattern = self.url_pattern(request.url)
+        self.decisions[pattern] = {"route": "browser", "decided": time.time()}
+        self.stats.inc_value(f"routing/escalated/{reason}")
+        spider.logger.info(f"Routing {pattern} through Playwright ({reason}): {request.url}")
+        meta = dict(request.meta, playwright=True, routing_route="browser")
+        return request.replace(meta=meta, dont_filter=True)
+
+    def process_response(self, request, response, spider):
+        if request.meta.get("routing_route") != "http":
+            return response
+
+        reason = self.check(request, response)
+        if reason:
+            return self.escalate(request, reason, spider)
+
+        self.decisions.setdefault(self.url_pattern(request.url), {"route": "http", "decided": time.time()})
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if request.meta.get("routing_route") == "http":
+            return self.escalate(request, "exception", spider)
+        return None
+
+    def spider_closed(self, spider):
+        if self.decisions_file:
+            with open(self.decisions_file, "w", encoding="utf-8") as f:
+                json.dump(self.decisions, f, indent=2, sort_keys=True)
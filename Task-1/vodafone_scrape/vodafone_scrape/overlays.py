@@ -0,0 +1,69 @@
+import json
+
+
+DISMISS_SCRIPT = """(() => {
+    const overlays = %s;
+    const dismissed = new WeakSet();
+    const visible = el => !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+
+    const sweep = () => {
+        for (const overlay of overlays) {
+            document.querySelectorAll(overlay.selector).forEach(el => {
+                if (dismissed.has(el) || !visible(el)) return;
+                dismissed.add(el);
+                el.click();
+                if (window.__overlayDismissed) window.__overlayDismissed(overlay.name);
+            });
+        }
+    };
+
+    let queued = false;
+    const schedule = () => {
+        if (queued) return;
+        queued = true;
+        setTimeout(() => { queued = false; sweep(); }, 50);
+    };
+    const start = () => {
+        sweep();
+        new MutationObserver(schedule).observe(document.documentElement, {
+            childList: true,
+            subtree: true,
+            attributes: true,
+            attributeFilter: ["class", "style", "hidden", "aria-hidden"],
+        });
+    };
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", start);
+    } else {
+        start();
+    }
+})();"""
+
+
+class OverlayDismisser:
+    """Dismiss known banners and modals the moment they appear.
+
+    The ``OVERLAYS`` registry (``{"name", "selector"}`` entries) is compiled
+    into a page init script that watches the DOM with a MutationObserver and
+    clicks any visible match, on every document the page loads. Each
+    dismissal is reported back and counted under ``overlays/dismissed/<name>``.
+    """
+
+    def __init__(self, overlays, crawler):
+        self.overlays = overlays
+        self.crawler = crawler
+        self.script = DISMISS_SCRIPT % json.dumps(overlays)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """The configured dismisser, or None when the ``OVERLAYS`` registry is empty."""
+        overlays = crawler.settings.getlist("OVERLAYS")
+        return cls(overlays, crawler) if overlays else None
+
+    async def install(self, page):
+        await page.expose_function("__overlayDismissed", self.record)
+        await page.add_init_script(self.script)
+
+    def record(self, name):
+        self.crawler.stats.inc_value("overlays/dismissed")
+        self.crawler.stats.inc_value(f"overlays/dismissed/{name}")
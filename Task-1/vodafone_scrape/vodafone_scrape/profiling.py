@@ -0,0 +1,134 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import time
+
+
+class ProfileSession:
+    """Profiling state for one product: Playwright trace, cProfile and network timings."""
+
+    def __init__(self, url, context_name):
+        self.url = url
+        self.context_name = context_name
+        self.profile = cProfile.Profile()
+        self.requests = []
+        self.started = time.monotonic()
+        self.context = None
+        self.profiled = False
+
+    def record_request(self, request):
+        timing = request.timing
+        if timing.get("responseEnd", -1) >= 0:
+            self.requests.append((timing["responseEnd"], request.resource_type, request.url))
+
+
+class Profiler:
+    """Opt-in per-product profiling, selected by sample rate or URL.
+
+    A selected product gets its own browser context with Playwright tracing
+    (screenshots, DOM snapshots, network, console) and a cProfile run around
+    its callback. Both are written to ``<product folder>/_profile/`` together
+    with ``summary.txt`` listing the top time sinks. Products that are not
+    selected get no extra meta and run exactly as before.
+
+    cProfile hooks the shared event-loop thread, so a profile covers every
+    coroutine that ran while the product was being captured, not only its
+    own. Only one product is profiled at a time: a selected product that
+    starts while another is being profiled still gets its trace, but no
+    ``python.prof``.
+    """
+
+    def __init__(self, sample_rate=0.0, urls=(), top=15, context_settings=None):
+        self.sample_rate = sample_rate
+        self.urls = list(urls)
+        self.top = top
+        self.context_settings = context_settings or {}
+        self.count = 0
+        self.active = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            sample_rate=settings.getfloat("PROFILE_SAMPLE_RATE", 0.0),
+            urls=settings.getlist("PROFILE_URLS"),
+            top=settings.getint("PROFILE_TOP", 15),
+            context_settings=settings.getdict("PLAYWRIGHT_CONTEXTS"),
+        )
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or bool(self.urls)
+
+    def select(self, url):
+        if not self.enabled:
+            return False
+        if any(pattern in url for pattern in self.urls):
+            return True
+        return random.random() < self.sample_rate
+
+    def request_meta(self, url, meta):
+        """Move a selected request into its own traced context; returns the extra meta."""
+        self.count += 1
+        base_context = meta.get("playwright_context", "default")
+        context_name = f"{base_context}-profile-{self.count}"
+        context_kwargs = meta.get("playwright_context_kwargs") or self.context_settings.get(base_context, {})
+        return {
+            "playwright_context": context_name,
+            "playwright_context_kwargs": dict(context_kwargs),
+            "profile_session": ProfileSession(url, context_name),
+        }
+
+    async def start_page(self, page, request):
+        """Start tracing before the first navigation (called from the page init callback)."""
+        session = request.meta["profile_session"]
+        if session.context is None:
+            session.context = page.context
+            await page.context.tracing.start(screenshots=True, snapshots=True, sources=False)
+            page.on("requestfinished", session.record_request)
+
+    async def run(self, session, callback, response, output_dir_key="screenshot_path"):
+        """Run ``callback(response)`` under cProfile and save trace, profile and summary."""
+        # One profiler per thread: Python 3.12+ refuses a second one, older versions replace the first
+        if self.active is None:
+            self.active = session
+            session.profiled = True
+            session.profile.enable()
+        try:
+            return await callback(response)
+        finally:
+            if session.profiled:
+                session.profile.disable()
+                self.active = None
+            output_dir = os.path.join(response.meta.get(output_dir_key) or "profiles", "_profile")
+            await self.save(session, output_dir)
+
+    async def save(self, session, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        wall = time.monotonic() - session.started
+
+        if session.context is not None:
+            await session.context.tracing.stop(path=os.path.join(output_dir, "trace.zip"))
+            # The context was created only for this product; release it right away
+            await session.context.close()
+
+        stream = io.StringIO()
+        if session.profiled:
+            session.profile.dump_stats(os.path.join(output_dir, "python.prof"))
+            pstats.Stats(session.profile, stream=stream).sort_stats("cumulative").print_stats(self.top)
+        else:
+            stream.write("  (not profiled: another product was being profiled at the same time)\n")
+
+        lines = [f"URL: {session.url}", f"Wall time: {wall:.1f}s", "", f"Slowest {self.top} network requests (ms):"]
+        for duration, resource_type, url in sorted(session.requests, reverse=True)[:self.top]:
+            lines.append(f"  {duration:9.0f}  {resource_type:<10} {url}")
+        lines += [
+            "",
+            f"Top {self.top} Python functions by cumulative time (whole event loop, not just this product):",
+            stream.getvalue(),
+        ]
+        lines.append("Open trace.zip with `playwright show-trace` for the full timeline.")
+
+        with open(os.path.join(output_dir, "summary.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
@@ -4,144 +4,320 @@ import os
 from urllib.parse import urlparse
 from scrapy_playwright.page import PageMethod
 
+from vodafone_scrape.asset_cache import AssetCache
+from vodafone_scrape.batch import ActionBatch
+from vodafone_scrape.canonical import ProductIndex
+from vodafone_scrape.locales import accept_language, load_profiles, request_meta, widen_concurrency
+from vodafone_scrape.overlays import OverlayDismisser
+from vodafone_scrape.postprocess import RegionRecorder
+from vodafone_scrape.profiling import Profiler
+from vodafone_scrape.scheduling import CaptureScheduler
+from vodafone_scrape.stability import RenderStabilizer
+from vodafone_scrape.steps import StepRunner
+from vodafone_scrape.storage import open_store
+
 
 class VodafoneProductSpider(scrapy.Spider):
     name = "vodafone_products"
+    locales = None  # -a locales=uk-london,uk-manchester
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.steps = StepRunner.from_crawler(crawler, spider.logger)
+        spider.step_timeout = crawler.settings.getint("STEP_TIMEOUT", 5000)
+        spider.profiles = load_profiles(crawler.settings, spider.locales)
+        spider.store = open_store(crawler.settings)
+        spider.index = ProductIndex.from_crawler(crawler)
+        spider.work_list = set()
+        spider.scheduler = CaptureScheduler.from_crawler(crawler, spider.logger)
+        spider.capture_targets = {}
+        spider.profiler = Profiler.from_settings(crawler.settings)
+        spider.stabilizer = RenderStabilizer.from_settings(crawler.settings)
+        spider.asset_cache = AssetCache.from_crawler(crawler)
+        spider.overlays = OverlayDismisser.from_crawler(crawler)
+        spider.regions = RegionRecorder.from_settings(crawler.settings)
+        widen_concurrency(crawler.settings, len(spider.profiles))
+        return spider
 
     def start_requests(self):
-        # Read first 5 product URLs from CSV
+        # Read product URLs from CSV
         with open("product_urls.csv", "r", encoding="utf-8") as f:
             reader = csv.DictReader(f)
-            urls = [row["url"] for row in reader][:5]
+            urls = [row["url"] for row in reader]
+
+        # One flow per canonical product, however the CSV spells its URL
+        urls = list(dict.fromkeys(self.index.resolve(url) for url in urls))
+        # Products most likely to have changed first, up to PRODUCT_LIMIT
+        urls = self.scheduler.plan(urls)
+        self.work_list = set(urls)
 
+        # Same product for every region back to back, so regions run side by side
+        regions = list(self.profiles.items()) or [(None, None)]
         for url in urls:
-            yield scrapy.Request(
-                url,
-                meta={
-                    "playwright": True,
-                    "playwright_include_page": True,  # to get playwright_page in meta
-                    "playwright_page_methods": [
-                        PageMethod("wait_for_load_state", "domcontentloaded"),
-
-                        # Accept cookies
-                        PageMethod(
-                            "evaluate",
-                            """() => {
-                                const cookieBtn = document.querySelector("#onetrust-accept-btn-handler");
-                                if (cookieBtn) cookieBtn.click();
-                            }"""
-                        ),
-                        PageMethod("wait_for_timeout", 1500),
-
-                        # Handle "Already with us?" modal
-                        PageMethod(
-                            "evaluate",
-                            """() => {
-                                const newCustBtn = document.querySelector("button[data-testid='newOrExisting-cta-new']");
-                                if (newCustBtn) newCustBtn.click();
-                            }"""
-                        ),
-                        PageMethod("wait_for_timeout", 2000),
-                    ],
-                    "screenshot_path": self.get_folder_name(url),
-                },
-                callback=self.parse_product,
-            )
+            for region, profile in regions:
+                yield self.product_request(url, region, profile)
+
+    def product_request(self, url, region=None, profile=None):
+        meta = {
+            "playwright": True,
+            "playwright_include_page": True,  # to get playwright_page in meta
+            # Cookie banner and "Already with us?" modal are handled by the overlay dismisser
+            "playwright_page_methods": [
+                PageMethod("wait_for_load_state", "domcontentloaded"),
+            ],
+            "screenshot_path": self.get_folder_name(url, region),
+        }
+        self.capture_targets[meta["screenshot_path"]] = (url, region)
+        headers = None
+        if region:
+            meta.update(request_meta(region, profile, self.settings))
+            if accept_language(profile):
+                headers = {"Accept-Language": accept_language(profile)}
 
-    def get_folder_name(self, url):
+        if self.profiler.select(url):
+            meta.update(self.profiler.request_meta(url, meta))
+        if self.overlays or self.stabilizer.enabled or self.asset_cache or meta.get("profile_session"):
+            meta["playwright_page_init_callback"] = self.init_page
+
+        # Each region fetches the same URL, so don't let the dupefilter drop them
+        return scrapy.Request(
+            url,
+            headers=headers,
+            meta=meta,
+            callback=self.parse_product,
+            priority=self.scheduler.priority(url),
+            dont_filter=bool(region),
+        )
+
+    def get_folder_name(self, url, region=None):
         """Extract clean folder name based on product model from URL"""
         parsed = urlparse(url)
         parts = parsed.path.strip("/").split("/")
         model_name = " ".join(p.capitalize() for p in parts[-2:])  # e.g. "Apple Iphone-13"
-        base_dir = os.path.join("Vodafone UK", model_name.replace("-", " "))
-        os.makedirs(base_dir, exist_ok=True)
-        return base_dir
+        return os.path.join("Vodafone UK", region or "", model_name.replace("-", " "))
+
+    async def capture(self, page, screenshot_path, step, clean_variant, full_page=True):
+        """Screenshot the page into the configured store as {step}_{variant}.png"""
+        regions = await self.regions.measure(page, full_page) if self.regions else None
+        data = await page.screenshot(full_page=full_page, **self.stabilizer.screenshot_kwargs())
+        self.store.save(
+            os.path.join(screenshot_path, f"{step}_{clean_variant}.png"),
+            data,
+            product=os.path.basename(screenshot_path),
+            variant=clean_variant,
+            step=step,
+            regions=regions,
+        )
+        url, region = self.capture_targets[screenshot_path]
+        await self.scheduler.record(page, data, url, region, clean_variant, step)
+        self.logger.info(f"{step} screenshot saved for {clean_variant}")
+
+    # --- Page state builders (also used to restore state before a step retry) ---
+
+    async def open_product(self, page, url):
+        """Navigate to the product page (popups are dismissed by the init script)."""
+        await page.goto(url, wait_until="domcontentloaded")
+
+    async def select_variant(self, page, variant, index):
+        """Open the capacity dropdown and pick option ``index`` (matched by ``variant`` text after a reload)."""
+        await (
+            ActionBatch()
+            .wait_for("#selectedCapacity", timeout=self.step_timeout, required=True)
+            .click("#selectedCapacity", required=True)
+            .wait(500)
+            .click("ul[role='listbox'] li", ref=("variants", index), text=variant, required=True)
+            .run(page)
+        )
+        await self.stabilizer.settle(page, 2000)
+
+    async def open_phone_plan(self, page):
+        """Build your own plan → Continue without trade in."""
+        await (
+            ActionBatch()
+            .wait_for("button", text="Build your own plan", timeout=self.step_timeout, required=True)
+            .click("button", text="Build your own plan", required=True)
+            .wait(2000)
+            .wait_for("button", text="Continue without trade in", timeout=self.step_timeout, required=True)
+            .click("button", text="Continue without trade in", required=True)
+            .run(page)
+        )
+        await page.wait_for_load_state("domcontentloaded")
+        await self.stabilizer.settle(page, 3000)
+
+    # --- Capture steps ---
+
+    async def capture_pdp(self, page, screenshot_path, clean_variant):
+        await self.capture(page, screenshot_path, "PDP", clean_variant)
+
+    async def capture_msrp(self, page, screenshot_path, clean_variant):
+        await (
+            ActionBatch()
+            .wait_for("button", text="Pay for your phone in one go", timeout=self.step_timeout, required=True)
+            .click("button", text="Pay for your phone in one go", required=True)
+            .run(page)
+        )
+        await self.stabilizer.settle(page, 2000)
+        await self.capture(page, screenshot_path, "MSRP", clean_variant, full_page=False)
+        # Close popup
+        await page.keyboard.press("Escape")
+        await page.wait_for_timeout(1000)
+
+    async def capture_phoneplan(self, page, screenshot_path, clean_variant):
+        await self.open_phone_plan(page)
+        await self.capture(page, screenshot_path, "Phoneplan", clean_variant)
+
+    async def capture_airtime(self, page, screenshot_path, clean_variant):
+        await (
+            ActionBatch()
+            .wait_for("button[data-selector='configurator-cta']", timeout=self.step_timeout, required=True)
+            .click("button[data-selector='configurator-cta']", required=True)
+            .run(page)
+        )
+        await page.wait_for_load_state("domcontentloaded")
+        await self.stabilizer.settle(page, 3000)
+        await self.capture(page, screenshot_path, "Airtime", clean_variant)
+
+    def is_redirected_duplicate(self, response):
+        """Record a redirect to another canonical URL; True if that product is already in this run's work list."""
+        requested = self.index.canonicalizer.canonical(response.request.url)
+        target = self.index.add_alias(response.request.url, response.url)
+        if target == requested:
+            return False
+        self.logger.info(f"{response.request.url} redirects to {response.url}")
+        if target in self.work_list:
+            self.crawler.stats.inc_value("dedupe/redirect_skipped")
+            self.logger.info(f"Skipping {response.request.url}: {target} is already being captured")
+            return True
+        return False
+
+    async def init_page(self, page, request):
+        """Runs before the first navigation of a page"""
+        if self.overlays:
+            await self.overlays.install(page)
+        await self.stabilizer.install(page)
+        if self.asset_cache:
+            await self.asset_cache.install(page)
+        if request.meta.get("profile_session"):
+            await self.profiler.start_page(page, request)
 
     async def parse_product(self, response):
+        if self.scheduler.budget.exhausted():
+            await response.meta["playwright_page"].close()
+            self.crawler.engine.close_spider(self, "run_budget_exceeded")
+            return
+        if self.is_redirected_duplicate(response):
+            await response.meta["playwright_page"].close()
+            return
+        session = response.meta.get("profile_session")
+        if session:
+            return await self.profiler.run(session, self.capture_product, response)
+        return await self.capture_product(response)
+
+    async def capture_product(self, response):
         page = response.meta.get("playwright_page")
         if not page:
             self.logger.error("Playwright page not found in response.meta")
             return
 
+        url = response.url
         screenshot_path = response.meta["screenshot_path"]
 
-        # --- Collect variant names ---
+        # --- Collect variant names (options are kept in-page for select_variant) ---
         try:
-            await page.wait_for_selector("#selectedCapacity", timeout=5000)
-            await page.click("#selectedCapacity")
-            await page.wait_for_timeout(1000)
-
-            variant_elements = await page.query_selector_all("ul[role='listbox'] li")
-            variant_texts = [await el.inner_text() for el in variant_elements]
+            results = await (
+                ActionBatch()
+                .wait_for("#selectedCapacity", timeout=5000, required=True)
+                .click("#selectedCapacity", required=True)
+                .wait(1000)
+                .texts("ul[role='listbox'] li", name="variants", keep="variants")
+                .run(page)
+            )
+            variant_texts = results["variants"]
         except Exception as e:
-            self.logger.error(f"No variants found for {response.url} → {e}")
+            self.logger.error(f"No variants found for {url} → {e}")
             await page.close()
             return
 
-        # --- Loop over variants ---
-        for variant in variant_texts:
-            clean_variant = variant.strip().replace(" ", "")
+        # --- Loop over variants, most likely changed first ---
+        clean_variants = [variant.strip().replace(" ", "") for variant in variant_texts]
+        ordered = self.scheduler.order_variants(response.request.url, clean_variants)
+        for position, (index, clean_variant) in enumerate(ordered):
+            variant = variant_texts[index]
+
+            async def restore_variant():
+                await self.open_product(page, url)
+                await self.select_variant(page, variant, index)
+
+            async def restore_phone_plan():
+                await restore_variant()
+                await self.open_phone_plan(page)
 
-            # Reopen dropdown each time
-            await page.click("#selectedCapacity")
-            await page.wait_for_timeout(500)
+            async def prepare_variant():
+                # The previous variant's flow ends on the Airtime page
+                if position:
+                    await self.open_product(page, url)
+                await self.select_variant(page, variant, index)
 
-            # Select variant by text
-            option = await page.query_selector(f"ul[role='listbox'] li:has-text('{variant}')")
-            if option:
-                await option.click()
-                await page.wait_for_timeout(2000)
+            if not await self.steps.run("Variant", prepare_variant, restore_variant):
+                self.logger.error(f"Could not select {clean_variant} for {url}, skipping variant")
+                continue
 
-                # --- 1. PDP Screenshot (full page) ---
-                await page.screenshot(
-                    path=os.path.join(screenshot_path, f"PDP_{clean_variant}.png"),
-                    full_page=True
+            await self.steps.run(
+                "PDP",
+                lambda: self.capture_pdp(page, screenshot_path, clean_variant),
+                restore_variant,
+            )
+            # Out-of-stock variants have no MSRP/plan buttons: skip those steps, don't retry them
+            offers = await (
+                ActionBatch()
+                .exists("button", name="msrp", text="Pay for your phone in one go")
+                .exists("button", name="plan", text="Build your own plan")
+                .run(page)
+            )
+
+            if offers["msrp"]:
+                await self.steps.run(
+                    "MSRP",
+                    lambda: self.capture_msrp(page, screenshot_path, clean_variant),
+                    restore_variant,
+                )
+            else:
+                self.steps.skip("MSRP", f"no one-off price for {clean_variant}")
+
+            if not offers["plan"]:
+                self.steps.skip("Phoneplan", f"no plan builder for {clean_variant}")
+                self.steps.skip("Airtime", f"no plan builder for {clean_variant}")
+                continue
+            if not await self.steps.run(
+                "Phoneplan",
+                lambda: self.capture_phoneplan(page, screenshot_path, clean_variant),
+                restore_variant,
+            ):
+                self.steps.skip("Airtime", f"plan builder failed for {clean_variant}")
+                continue
+
+            has_airtime = await ActionBatch().exists("button[data-selector='configurator-cta']", name="cta").run(page)
+            if has_airtime["cta"]:
+                await self.steps.run(
+                    "Airtime",
+                    lambda: self.capture_airtime(page, screenshot_path, clean_variant),
+                    restore_phone_plan,
                 )
-                self.logger.info(f"PDP screenshot saved for {clean_variant}")
-
-                # --- 2. MSRP Screenshot (popup only) ---
-                msrp_btn = await page.query_selector("button:has-text('Pay for your phone in one go')")
-                if msrp_btn:
-                    await msrp_btn.click()
-                    await page.wait_for_timeout(2000)
-                    await page.screenshot(
-                        path=os.path.join(screenshot_path, f"MSRP_{clean_variant}.png"),
-                        full_page=False
-                    )
-                    # Close popup
-                    await page.keyboard.press("Escape")
-                    await page.wait_for_timeout(1000)
-                    self.logger.info(f"MSRP screenshot saved for {clean_variant}")
-
-                # --- 3. Phoneplan Screenshot ---
-                build_btn = await page.query_selector("button:has-text('Build your own plan')")
-                if build_btn:
-                    await build_btn.click()
-                    await page.wait_for_timeout(2000)
-
-                    cont_btn = await page.query_selector("button:has-text('Continue without trade in')")
-                    if cont_btn:
-                        await cont_btn.click()
-                        await page.wait_for_load_state("domcontentloaded")
-                        await page.wait_for_timeout(3000)
-
-                        await page.screenshot(
-                            path=os.path.join(screenshot_path, f"Phoneplan_{clean_variant}.png"),
-                            full_page=True
-                        )
-                        self.logger.info(f"Phoneplan screenshot saved for {clean_variant}")
-
-                # --- 4. Airtime Screenshot ---
-                continue_btn = await page.query_selector("button[data-selector='configurator-cta']")
-                if continue_btn:
-                    await continue_btn.click()
-                    await page.wait_for_load_state("domcontentloaded")
-                    await page.wait_for_timeout(3000)
-
-                    await page.screenshot(
-                        path=os.path.join(screenshot_path, f"Airtime_{clean_variant}.png"),
-                        full_page=True
-                    )
-                    self.logger.info(f"Airtime screenshot saved for {clean_variant}")
+            else:
+                self.steps.skip("Airtime", f"no airtime step for {clean_variant}")
 
+        self.scheduler.finished(response.request.url)
         await page.close()
+
+    def closed(self, reason):
+        self.store.close()
+        self.index.close()
+        if self.asset_cache:
+            self.asset_cache.close()
+        for name, counts in self.steps.report().items():
+            self.logger.info(
+                f"Step {name}: {counts['success']} succeeded, "
+                f"{counts['retries']} retries, {counts['failed']} failed, {counts['skipped']} skipped"
+            )
+        self.scheduler.report()
@@ -0,0 +1,65 @@
+import asyncio
+
+
+class StepRunner:
+    """Run capture steps with their own retry budget and exponential back-off.
+
+    Each step is an ``action`` coroutine plus a ``restore`` coroutine that
+    rebuilds only the page state the step needs (navigate, select variant,
+    click through) before a retry. Results are counted in the crawler stats
+    under ``steps/<name>/success|retries|failed|skipped``.
+    """
+
+    def __init__(self, crawler, logger, retries=2, backoff=2.0, backoff_max=30.0):
+        self.crawler = crawler
+        self.logger = logger
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+    @classmethod
+    def from_crawler(cls, crawler, logger):
+        settings = crawler.settings
+        return cls(
+            crawler,
+            logger,
+            retries=settings.getint("STEP_RETRY_TIMES", 2),
+            backoff=settings.getfloat("STEP_RETRY_BACKOFF", 2.0),
+            backoff_max=settings.getfloat("STEP_RETRY_BACKOFF_MAX", 30.0),
+        )
+
+    async def run(self, name, action, restore=None):
+        """Run ``action``; on failure wait, ``restore`` and retry. Returns True on success."""
+        for attempt in range(self.retries + 1):
+            try:
+                if attempt:
+                    delay = min(self.backoff * 2 ** (attempt - 1), self.backoff_max)
+                    await asyncio.sleep(delay)
+                    if restore:
+                        await restore()
+                await action()
+            except Exception as e:
+                self.logger.warning(f"Step {name} failed (attempt {attempt + 1}/{self.retries + 1}) → {e}")
+                if attempt < self.retries:
+                    self.crawler.stats.inc_value(f"steps/{name}/retries")
+                continue
+            self.crawler.stats.inc_value(f"steps/{name}/success")
+            return True
+
+        self.crawler.stats.inc_value(f"steps/{name}/failed")
+        return False
+
+    def skip(self, name, reason):
+        """Count a step that does not apply to the current page (e.g. out of stock)."""
+        self.logger.info(f"Step {name} skipped → {reason}")
+        self.crawler.stats.inc_value(f"steps/{name}/skipped")
+
+    def report(self):
+        """Return ``{step: {"success": n, "retries": n, "failed": n, "skipped": n}}`` from the stats."""
+        summary = {}
+        for key, value in self.crawler.stats.get_stats().items():
+            if not key.startswith("steps/"):
+                continue
+            _, name, outcome = key.split("/", 2)
+            summary.setdefault(name, {"success": 0, "retries": 0, "failed": 0, "skipped": 0})[outcome] = value
+        return summary
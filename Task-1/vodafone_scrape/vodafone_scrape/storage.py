@@ -0,0 +1,217 @@
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import tarfile
+import time
+
+
+REGIONS_FILE = "_regions.json"
+
+
+def load_regions(folder):
+    """The ``_regions.json`` sidecar of a capture folder as ``{file name: entry}``."""
+    try:
+        with open(os.path.join(folder, REGIONS_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_regions(folder, entries):
+    with open(os.path.join(folder, REGIONS_FILE), "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=1, sort_keys=True)
+
+
+class FolderStore:
+    """Write every capture as a loose file under ``root`` (the original layout).
+
+    Mask regions recorded with a capture go to a ``_regions.json`` sidecar in
+    the same folder, keyed by file name.
+    """
+
+    def __init__(self, root="."):
+        self.root = root
+
+    def save(self, path, data, product=None, variant=None, step=None, regions=None):
+        full_path = os.path.join(self.root, path)
+        folder = os.path.dirname(full_path)
+        os.makedirs(folder, exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(data)
+
+        entries = load_regions(folder)
+        name = os.path.basename(full_path)
+        if regions is not None:
+            entries[name] = {"regions": regions, "processed": False}
+            save_regions(folder, entries)
+        elif name in entries:
+            # A fresh capture without regions replaces the old record
+            del entries[name]
+            save_regions(folder, entries)
+        return full_path
+
+    def close(self):
+        pass
+
+
+class ArchiveStore:
+    """Append captures to rolling, uncompressed tar segments with a SQLite manifest.
+
+    Every capture is indexed with product, variant, step, timestamp, size,
+    segment, byte offset and SHA-256, so a single image can be read back with
+    one seek instead of unpacking a segment. A new segment is started once the
+    current one grows past ``segment_bytes``; existing segments are never
+    reopened for writing.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS captures (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            product TEXT,
+            variant TEXT,
+            step TEXT,
+            timestamp REAL NOT NULL,
+            size INTEGER NOT NULL,
+            segment TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            regions TEXT
+        );
+        CREATE INDEX IF NOT EXISTS captures_path ON captures (path);
+        CREATE INDEX IF NOT EXISTS captures_product ON captures (product, variant, step);
+    """
+
+    def __init__(self, directory="archive", segment_bytes=512 * 1024 * 1024, prefix="captures"):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.prefix = prefix
+        os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(os.path.join(directory, "manifest.sqlite"))
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(self.SCHEMA)
+
+        # Continue after the highest segment; earlier ones may have been pruned
+        numbers = [
+            int(name[len(prefix) + 1:-4])
+            for name in map(os.path.basename, glob.glob(os.path.join(directory, f"{prefix}-*.tar")))
+            if name[len(prefix) + 1:-4].isdigit()
+        ]
+        self.segment_number = max(numbers, default=0)
+        self.segment_name = None
+        self.tar = None
+
+    def _roll(self):
+        if self.tar:
+            self.tar.close()
+        self.segment_number += 1
+        self.segment_name = f"{self.prefix}-{self.segment_number:05d}.tar"
+        # "x": never truncate an existing segment
+        self.tar = tarfile.open(os.path.join(self.directory, self.segment_name), "x", format=tarfile.PAX_FORMAT)
+
+    def save(self, path, data, product=None, variant=None, step=None, regions=None):
+        if self.tar is None or self.tar.offset >= self.segment_bytes:
+            self._roll()
+
+        timestamp = time.time()
+        info = tarfile.TarInfo(name=path.replace(os.sep, "/"))
+        info.size = len(data)
+        info.mtime = int(timestamp)
+        # The data starts right after the member's header blocks, which addfile() writes first
+        offset = self.tar.offset + len(info.tobuf(self.tar.format, self.tar.encoding, self.tar.errors))
+        self.tar.addfile(info, io.BytesIO(data))
+        self.tar.fileobj.flush()
+
+        self.db.execute(
+            "INSERT INTO captures (path, product, variant, step, timestamp, size, segment, offset, sha256, regions)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (info.name, product, variant, step, timestamp, len(data), self.segment_name, offset,
+             hashlib.sha256(data).hexdigest(), None if regions is None else json.dumps(regions)),
+        )
+        self.db.commit()
+        return f"{self.segment_name}:{info.name}"
+
+    def query(self, **filters):
+        """Manifest rows matching column equality ``filters``, newest first."""
+        where = " AND ".join(f"{column} = ?" for column in filters) or "1"
+        return self.db.execute(
+            f"SELECT * FROM captures WHERE {where} ORDER BY timestamp DESC, id DESC", tuple(filters.values())
+        ).fetchall()
+
+    def read(self, path):
+        """Return the bytes of the latest capture stored under ``path``."""
+        rows = self.query(path=path.replace(os.sep, "/"))
+        if not rows:
+            raise KeyError(path)
+        return self.read_row(rows[0])
+
+    def read_row(self, row):
+        with open(os.path.join(self.directory, row["segment"]), "rb") as f:
+            f.seek(row["offset"])
+            data = f.read(row["size"])
+        if hashlib.sha256(data).hexdigest() != row["sha256"]:
+            raise ValueError(f"Checksum mismatch for {row['path']} in {row['segment']}")
+        return data
+
+    def latest(self):
+        """The newest manifest row of every path."""
+        seen = set()
+        for row in self.db.execute("SELECT * FROM captures ORDER BY timestamp DESC, id DESC").fetchall():
+            if row["path"] not in seen:
+                seen.add(row["path"])
+                yield row
+
+    def export(self, destination):
+        """Write the latest capture of every path out as the loose-folder layout."""
+        folder = FolderStore(destination)
+        exported = 0
+        for row in self.latest():
+            regions = json.loads(row["regions"]) if row["regions"] else None
+            folder.save(row["path"], self.read_row(row), regions=regions)
+            exported += 1
+        return exported
+
+    def close(self):
+        if self.tar:
+            self.tar.close()
+            self.tar = None
+        self.db.close()
+
+
+def open_store(settings):
+    """Build the screenshot store configured by ``SCREENSHOT_STORE``."""
+    backend = settings.get("SCREENSHOT_STORE", "folder")
+    if backend == "folder":
+        return FolderStore()
+    if backend == "archive":
+        return ArchiveStore(
+            settings.get("ARCHIVE_DIR", "archive"),
+            segment_bytes=settings.getint("ARCHIVE_SEGMENT_BYTES", 512 * 1024 * 1024),
+        )
+    raise ValueError(f"Unknown SCREENSHOT_STORE: {backend}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or export a screenshot archive")
+    parser.add_argument("archive", help="archive directory (holds manifest.sqlite)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_cmd = commands.add_parser("list", help="list manifest entries")
+    list_cmd.add_argument("--product")
+    list_cmd.add_argument("--step")
+    export_cmd = commands.add_parser("export", help="export the loose-folder layout")
+    export_cmd.add_argument("destination")
+    args = parser.parse_args()
+
+    store = ArchiveStore(args.archive)
+    if args.command == "list":
+        filters = {k: v for k, v in (("product", args.product), ("step", args.step)) if v}
+        for row in store.query(**filters):
+            print(f"{row['path']}\t{row['size']}\t{row['segment']}@{row['offset']}\t{row['sha256'][:12]}")
+    else:
+        print(f"Exported {store.export(args.destination)} files to {args.destination}")
+    store.close()
@@ -0,0 +1,148 @@
+import re
+import sqlite3
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+class Canonicalizer:
+    """Reduce product URLs to one canonical form using per-carrier rules.
+
+    The scheme and host are normalised to the carrier's site, fragments and
+    tracking or variant query parameters are dropped (only ``keep_params``
+    survive), duplicate and trailing slashes are removed, the path is cut to
+    ``path_depth`` segments and ``suffixes`` patterns (e.g. colour/size slugs)
+    are stripped from its last segment.
+    """
+
+    def __init__(self, base_url, path_depth=0, keep_params=(), suffixes=()):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or "https"
+        self.host = parts.netloc.lower()
+        self.path_depth = path_depth
+        self.keep_params = set(keep_params)
+        self.suffixes = [re.compile(pattern) for pattern in suffixes]
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings.get("CANONICAL_BASE_URL"),
+            path_depth=settings.getint("CANONICAL_PATH_DEPTH", 0),
+            keep_params=settings.getlist("CANONICAL_KEEP_PARAMS"),
+            suffixes=settings.getlist("CANONICAL_PATH_SUFFIXES"),
+        )
+
+    def canonical(self, url):
+        parts = urlsplit(url.strip())
+        host = parts.netloc.lower()
+        if host.split(":")[0] in (self.host, self.host.removeprefix("www.")):
+            host = self.host
+
+        segments = [s for s in parts.path.lower().split("/") if s]
+        if self.path_depth:
+            segments = segments[:self.path_depth]
+        if segments:
+            for pattern in self.suffixes:
+                segments[-1] = pattern.sub("", segments[-1])
+
+        query = sorted((k, v) for k, v in parse_qsl(parts.query) if k in self.keep_params)
+        return urlunsplit((self.scheme, host, "/" + "/".join(segments), urlencode(query), ""))
+
+
+class ProductIndex:
+    """Persistent, sorted on-disk set of canonical product URLs plus known aliases.
+
+    Products and aliases live in SQLite ``WITHOUT ROWID`` tables, i.e. B-trees
+    keyed by URL, so lookups stay cheap and nothing is held in memory however
+    many runs have fed the index. Every URL goes through the canonicalizer
+    and then the alias table (redirects seen earlier), so each product is
+    reported once per run whatever form it was linked in.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS products (
+            url TEXT PRIMARY KEY,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            run INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS products_run ON products (run);
+        CREATE TABLE IF NOT EXISTS aliases (
+            alias TEXT PRIMARY KEY,
+            url TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path, canonicalizer, crawler):
+        self.canonicalizer = canonicalizer
+        self.crawler = crawler
+        self.run = time.time_ns()
+        self.db = sqlite3.connect(path)
+        self.db.executescript(self.SCHEMA)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            crawler.settings.get("PRODUCT_INDEX_FILE", "product_index.sqlite"),
+            Canonicalizer.from_settings(crawler.settings),
+            crawler,
+        )
+
+    def _inc(self, key):
+        self.crawler.stats.inc_value(f"dedupe/{key}")
+
+    def resolve(self, url):
+        """Canonical URL of ``url``, following recorded redirects."""
+        canonical = self.canonicalizer.canonical(url)
+        row = self.db.execute("SELECT url FROM aliases WHERE alias = ?", (canonical,)).fetchone()
+        return row[0] if row else canonical
+
+    def add(self, url):
+        """Record ``url`` as found in this run; returns (canonical, True if not seen yet this run)."""
+        canonical = self.resolve(url)
+        now = time.time()
+        row = self.db.execute("SELECT run FROM products WHERE url = ?", (canonical,)).fetchone()
+        if row and row[0] == self.run:
+            self._inc("duplicates")
+            return canonical, False
+        if row:
+            self.db.execute("UPDATE products SET last_seen = ?, run = ? WHERE url = ?", (now, self.run, canonical))
+        else:
+            self.db.execute(
+                "INSERT INTO products (url, first_seen, last_seen, run) VALUES (?, ?, ?, ?)",
+                (canonical, now, now, self.run),
+            )
+            self._inc("new")
+        self.db.commit()
+        self._inc("unique")
+        return canonical, True
+
+    def add_alias(self, url, target):
+        """Remember that ``url`` redirects to ``target``; returns the canonical target."""
+        alias = self.canonicalizer.canonical(url)
+        canonical = self.resolve(target)
+        if alias == canonical:
+            return canonical
+        self.db.execute("INSERT OR REPLACE INTO aliases (alias, url) VALUES (?, ?)", (alias, canonical))
+        # Earlier aliases pointing at the old form now point at the target too
+        self.db.execute("UPDATE aliases SET url = ? WHERE url = ?", (canonical, alias))
+        # The alias stops being a product of its own; the target inherits its history
+        row = self.db.execute("SELECT first_seen, last_seen, run FROM products WHERE url = ?", (alias,)).fetchone()
+        if row:
+            self.db.execute("DELETE FROM products WHERE url = ?", (alias,))
+            self.db.execute(
+                "INSERT INTO products (url, first_seen, last_seen, run) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (url) DO UPDATE SET first_seen = MIN(first_seen, excluded.first_seen),"
+                " last_seen = MAX(last_seen, excluded.last_seen), run = MAX(run, excluded.run)",
+                (canonical, *row),
+            )
+        self.db.commit()
+        self._inc("redirects")
+        return canonical
+
+    def found(self):
+        """Canonical URLs recorded in this run, in sorted order."""
+        for (url,) in self.db.execute("SELECT url FROM products WHERE run = ? ORDER BY url", (self.run,)):
+            yield url
+
+    def close(self):
+        self.db.close()
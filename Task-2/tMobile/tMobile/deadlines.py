@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+
+class ProductTimedOut(Exception):
+    """A product flow ran past its time budget and was cancelled."""
+
+
+class ProductProgress:
+    """Which step a product's flow is in and what it has captured so far."""
+
+    def __init__(self, url, region=None):
+        self.url = url
+        self.region = region
+        self.product = None
+        self.step = "start"
+        self.captured = []
+        self.started = time.monotonic()
+
+    def enter(self, step):
+        self.step = step
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+
+class DeadlineScheduler:
+    """Enforce per-product and per-run time budgets with asyncio cancellation.
+
+    A product flow runs under ``asyncio.wait_for``; when its budget (or what
+    is left of the run's ``RunBudget``) runs out, the flow is cancelled at its
+    current await and ``ProductTimedOut`` is raised so the caller can release
+    the page and context. Whatever was captured before that stays saved.
+    Timed-out and failed products are recorded with the step they were in.
+    """
+
+    def __init__(self, crawler, logger, budget, product_budget=300, requeue_times=1,
+                 requeue_priority_adjust=-10):
+        self.crawler = crawler
+        self.logger = logger
+        self.product_budget = product_budget
+        self.budget = budget
+        self.requeue_times = requeue_times
+        self.requeue_priority_adjust = requeue_priority_adjust
+        self.timeouts = []
+        self.failures = []
+
+    @classmethod
+    def from_crawler(cls, crawler, logger, budget):
+        settings = crawler.settings
+        return cls(
+            crawler,
+            logger,
+            budget,
+            product_budget=settings.getfloat("PRODUCT_TIME_BUDGET", 300),
+            requeue_times=settings.getint("PRODUCT_TIMEOUT_REQUEUE_TIMES", 1),
+            requeue_priority_adjust=settings.getint("PRODUCT_TIMEOUT_PRIORITY_ADJUST", -10),
+        )
+
+    def budget_for(self, spent=0.0):
+        """Seconds left for a product that already spent ``spent`` (e.g. downloading)."""
+        budget = self.product_budget - spent if self.product_budget else None
+        remaining = self.budget.remaining()
+        if remaining is not None:
+            budget = remaining if budget is None else min(budget, remaining)
+        return None if budget is None else max(budget, 0)
+
+    async def run(self, progress, coro, spent=0.0):
+        try:
+            return await asyncio.wait_for(coro, self.budget_for(spent))
+        except asyncio.TimeoutError:
+            self.timeouts.append({
+                "url": progress.url,
+                "step": progress.step,
+                "elapsed": round(progress.elapsed + spent, 1),
+                "captured": len(progress.captured),
+            })
+            self.crawler.stats.inc_value("deadline/product_timeouts")
+            self.crawler.stats.inc_value(f"deadline/product_timeouts/{progress.step.split(':')[0]}")
+            self.logger.warning(
+                f"Product budget exceeded in step '{progress.step}' after {progress.elapsed + spent:.0f}s "
+                f"({len(progress.captured)} screenshots kept): {progress.url}"
+            )
+            raise ProductTimedOut(progress.url)
+        except Exception as e:
+            self.failures.append({
+                "url": progress.url,
+                "step": progress.step,
+                "error": f"{type(e).__name__}: {e}",
+                "captured": len(progress.captured),
+            })
+            self.crawler.stats.inc_value("deadline/product_failures")
+            self.crawler.stats.inc_value(f"deadline/product_failures/{progress.step.split(':')[0]}")
+            raise
+
+    def requeue(self, request, fresh, floor=None):
+        """Schedule ``fresh`` (a rebuilt ``request``) at lower priority, or None when out of retries.
+
+        With ``floor`` (the lowest priority still queued), the retry goes
+        behind everything else rather than just below its old priority.
+        """
+        attempt = request.meta.get("deadline_requeues", 0) + 1
+        if attempt > self.requeue_times or self.budget.exhausted():
+            return None
+        self.crawler.stats.inc_value("deadline/requeued")
+        base = request.priority if floor is None else min(request.priority, floor)
+        return fresh.replace(
+            meta=dict(fresh.meta, deadline_requeues=attempt),
+            priority=base + self.requeue_priority_adjust,
+            dont_filter=True,
+        )
+
+    def report(self):
+        for t in self.timeouts:
+            self.logger.info(
+                f"Budget blown: {t['url']} in step '{t['step']}' after {t['elapsed']}s "
+                f"({t['captured']} screenshots kept)"
+            )
+        for f in self.failures:
+            self.logger.info(
+                f"Failed: {f['url']} in step '{f['step']}' ({f['error']}, {f['captured']} screenshots kept)"
+            )
+        if self.budget.exhausted():
+            self.logger.info(f"Run budget of {self.budget.seconds:.0f}s exhausted")
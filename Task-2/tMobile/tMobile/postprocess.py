@@ -0,0 +1,215 @@
+import argparse
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from tMobile.storage import ArchiveStore, load_regions, save_regions
+
+
+MEASURE_SCRIPT = """([regions, fullPage]) => {
+    const scale = window.devicePixelRatio || 1;
+    const pinned = el => {
+        for (let node = el; node; node = node.parentElement) {
+            const position = getComputedStyle(node).position;
+            if (position === "fixed" || position === "sticky") return true;
+        }
+        return false;
+    };
+    const boxes = [];
+    for (const region of regions) {
+        document.querySelectorAll(region.selector).forEach(el => {
+            if (fullPage && pinned(el)) {
+                // Painted relative to the viewport, not at rect + scroll: hide instead of masking
+                el.style.setProperty("visibility", "hidden", "important");
+                return;
+            }
+            const rect = el.getBoundingClientRect();
+            if (!rect.width || !rect.height) return;
+            const x = rect.left + (fullPage ? window.scrollX : 0);
+            const y = rect.top + (fullPage ? window.scrollY : 0);
+            boxes.push({
+                name: region.name,
+                x: Math.floor(x * scale),
+                y: Math.floor(y * scale),
+                width: Math.ceil(rect.width * scale),
+                height: Math.ceil(rect.height * scale),
+            });
+        });
+    }
+    return boxes;
+}"""
+
+
+class RegionRecorder:
+    """Record the boxes of volatile page elements at capture time.
+
+    ``MASK_REGIONS`` lists ``{"name", "selector"}`` entries per carrier
+    (countdown timers, chat bubbles, rotating banners). Right before a
+    screenshot their bounding boxes are measured in screenshot pixels and
+    stored with the capture, so the post-processing job can blank them out
+    without a browser. In full-page captures, fixed and sticky elements (or
+    ones inside such a container) do not paint where the page scroll says,
+    so they are hidden for the rest of the page's life instead; their layout
+    space is kept.
+    """
+
+    def __init__(self, regions):
+        self.regions = regions
+
+    @classmethod
+    def from_settings(cls, settings):
+        """The configured recorder, or None when ``MASK_REGIONS`` is empty."""
+        regions = settings.getlist("MASK_REGIONS")
+        return cls(regions) if regions else None
+
+    async def measure(self, page, full_page=True):
+        return await page.evaluate(MEASURE_SCRIPT, [self.regions, full_page])
+
+
+def process_image(data, regions=(), tolerance=8, margin=16):
+    """Blank out ``regions`` and trim uniform borders; returns PNG bytes.
+
+    The background is the colour of the top-left pixel. Masked boxes are
+    filled with it, then rows and columns that stay within ``tolerance`` of
+    it on every channel are cropped away, keeping ``margin`` pixels.
+    """
+    image = Image.open(io.BytesIO(data))
+    pixels = np.array(image.convert("RGBA" if "A" in image.getbands() else "RGB"))
+    height, width = pixels.shape[:2]
+    background = pixels[0, 0].copy()
+
+    for box in regions:
+        x0, y0 = max(box["x"], 0), max(box["y"], 0)
+        x1, y1 = min(box["x"] + box["width"], width), min(box["y"] + box["height"], height)
+        if x0 < x1 and y0 < y1:
+            pixels[y0:y1, x0:x1] = background
+
+    content = (np.abs(pixels.astype(np.int16) - background).max(axis=2) > tolerance)
+    rows = np.flatnonzero(content.any(axis=1))
+    cols = np.flatnonzero(content.any(axis=0))
+    if rows.size:
+        top, bottom = max(rows[0] - margin, 0), min(rows[-1] + 1 + margin, height)
+        left, right = max(cols[0] - margin, 0), min(cols[-1] + 1 + margin, width)
+        pixels = pixels[top:bottom, left:right]
+
+    out = io.BytesIO()
+    Image.fromarray(pixels).save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def process_bytes(data, regions, tolerance, margin):
+    """Worker job: processed PNG bytes, or ``data`` itself when that would only grow it."""
+    result = process_image(data, regions, tolerance, margin)
+    if not regions and len(result) >= len(data):
+        # Nothing to mask and no gain from trimming
+        return data
+    return result
+
+
+def process_file(path, regions, tolerance, margin):
+    """Worker job: rewrite ``path`` in place; returns (path, bytes before, bytes after)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    result = process_bytes(data, regions, tolerance, margin)
+    if result is not data:
+        with open(path, "wb") as f:
+            f.write(result)
+    return path, len(data), len(result)
+
+
+def process_folder(root, workers=None, tolerance=8, margin=16):
+    """Post-process every unprocessed PNG under ``root`` in a process pool.
+
+    Returns ``(images, bytes before, bytes after)``. Images are marked as
+    processed in their folder's ``_regions.json`` so a later run skips them
+    (their recorded boxes no longer match once trimmed).
+    """
+    jobs = []
+    for folder, _, files in os.walk(root):
+        entries = load_regions(folder)
+        for name in sorted(files):
+            if not name.lower().endswith(".png"):
+                continue
+            entry = entries.get(name, {})
+            if entry.get("processed"):
+                continue
+            jobs.append((folder, name, entry.get("regions") or []))
+
+    images, before, after = 0, 0, 0
+    with ProcessPoolExecutor(max_workers=workers or None) as pool:
+        futures = [
+            (folder, name, pool.submit(process_file, os.path.join(folder, name), regions, tolerance, margin))
+            for folder, name, regions in jobs
+        ]
+        done = {}
+        for folder, name, future in futures:
+            _, size_before, size_after = future.result()
+            images += 1
+            before += size_before
+            after += size_after
+            done.setdefault(folder, []).append(name)
+
+    for folder, names in done.items():
+        entries = load_regions(folder)
+        for name in names:
+            entries[name] = dict(entries.get(name, {}), processed=True)
+        save_regions(folder, entries)
+    return images, before, after
+
+
+def process_archive(source, destination, workers=None, tolerance=8, margin=16):
+    """Write post-processed copies of the latest captures in ``source`` to a new archive."""
+    src = ArchiveStore(source)
+    dst = ArchiveStore(destination)
+    images, before, after = 0, 0, 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers or None) as pool:
+            # Keep only a few images per worker in flight, not the whole archive
+            window = 4 * (workers or os.cpu_count() or 1)
+            pending = []
+            rows = src.latest()
+            while True:
+                for row in rows:
+                    data = src.read_row(row)
+                    regions = json.loads(row["regions"]) if row["regions"] else []
+                    pending.append((row, len(data), pool.submit(process_bytes, data, regions, tolerance, margin)))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                row, size_before, future = pending.pop(0)
+                data = future.result()
+                dst.save(row["path"], data, product=row["product"], variant=row["variant"], step=row["step"])
+                images += 1
+                before += size_before
+                after += len(data)
+    finally:
+        src.close()
+        dst.close()
+    return images, before, after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mask volatile regions and trim blank margins from screenshots")
+    parser.add_argument("source", help="screenshot folder, or archive directory with --output")
+    parser.add_argument("--output", help="write an archive's processed captures to this new archive")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--tolerance", type=int, default=8, help="max channel difference counted as blank")
+    parser.add_argument("--margin", type=int, default=16, help="pixels kept around the content")
+    args = parser.parse_args()
+
+    if os.path.exists(os.path.join(args.source, "manifest.sqlite")):
+        if not args.output:
+            parser.error("archives are not rewritten in place, pass --output")
+        images, before, after = process_archive(args.source, args.output, args.workers, args.tolerance, args.margin)
+    else:
+        images, before, after = process_folder(args.source, args.workers, args.tolerance, args.margin)
+
+    saved = before - after
+    percent = 100 * saved / before if before else 0
+    print(f"Processed {images} images: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB "
+          f"({saved / 1e6:.1f} MB saved, {percent:.0f}%)")
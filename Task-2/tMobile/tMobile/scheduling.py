@@ -0,0 +1,196 @@
+import hashlib
+import sqlite3
+import time
+
+
+FINGERPRINT_SCRIPT = """(selectors) => selectors
+    .flatMap(selector => Array.from(document.querySelectorAll(selector), el => el.innerText.trim()))
+    .filter(Boolean)
+    .join("\\n")"""
+
+
+class CaptureHistory:
+    """What every product/variant/step capture looked like last time, and how often it changed.
+
+    One row per (url, region, variant, step) keeps the latest fingerprint,
+    when it was taken, and how many captures and changes have been seen.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS shots (
+            url TEXT NOT NULL,
+            region TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            step TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            captured REAL NOT NULL,
+            captures INTEGER NOT NULL,
+            changes INTEGER NOT NULL,
+            PRIMARY KEY (url, region, variant, step)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(self.SCHEMA)
+
+    def record(self, url, region, variant, step, fingerprint):
+        """Store a capture's fingerprint; returns True when it differs from the previous one."""
+        key = (url, region or "", variant or "", step)
+        row = self.db.execute(
+            "SELECT fingerprint FROM shots WHERE url = ? AND region = ? AND variant = ? AND step = ?", key
+        ).fetchone()
+        changed = row is not None and row[0] != fingerprint
+        self.db.execute(
+            "INSERT INTO shots (url, region, variant, step, fingerprint, captured, captures, changes)"
+            " VALUES (?, ?, ?, ?, ?, ?, 1, 0)"
+            " ON CONFLICT (url, region, variant, step) DO UPDATE SET fingerprint = excluded.fingerprint,"
+            " captured = excluded.captured, captures = captures + 1, changes = changes + ?",
+            (*key, fingerprint, time.time(), int(changed)),
+        )
+        self.db.commit()
+        return changed
+
+    def summary(self, url, variant=None):
+        """(last capture time or None, compared captures, changes) for a product or one of its variants."""
+        query = "SELECT MAX(captured), SUM(captures - 1), SUM(changes) FROM shots WHERE url = ?"
+        params = (url,)
+        if variant is not None:
+            query += " AND variant = ?"
+            params += (variant,)
+        last, compared, changes = self.db.execute(query, params).fetchone()
+        return last, compared or 0, changes or 0
+
+    def close(self):
+        self.db.close()
+
+
+class RunBudget:
+    """Wall-clock budget for a whole run (``RUN_TIME_BUDGET`` seconds, 0 for none)."""
+
+    def __init__(self, seconds=0):
+        self.seconds = seconds
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        """Seconds left, or None without a budget."""
+        return self.seconds - self.elapsed if self.seconds else None
+
+    def exhausted(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+
+class CaptureScheduler:
+    """Order product and variant captures by how likely they are to have changed.
+
+    A capture's score is its business weight (``PRODUCT_WEIGHTS``, matched
+    by URL substring) times a blend of staleness (time since the last
+    capture, saturating at ``SCHEDULE_STALENESS_HOURS``; never captured
+    counts as fully stale) and volatility (the smoothed share of past
+    captures whose price/promo fingerprint changed). Products are queued in
+    score order with a matching Scrapy priority and cut to ``PRODUCT_LIMIT``,
+    and coverage of the planned score is reported against the run budget
+    (``budget``, shared with anything else that enforces it).
+    """
+
+    def __init__(self, history, crawler, logger, limit=0, staleness_hours=168.0, staleness_weight=1.0,
+                 volatility_weight=1.0, weights=None, change_selectors=(), budget=None):
+        self.history = history
+        self.crawler = crawler
+        self.logger = logger
+        self.limit = limit
+        self.staleness_hours = staleness_hours
+        self.staleness_weight = staleness_weight
+        self.volatility_weight = volatility_weight
+        self.weights = weights or {}
+        self.change_selectors = list(change_selectors)
+        self.budget = budget or RunBudget()
+        self.available = 0
+        self.planned = {}
+        self.captured = set()
+
+    @classmethod
+    def from_crawler(cls, crawler, logger):
+        settings = crawler.settings
+        return cls(
+            CaptureHistory(settings.get("CAPTURE_HISTORY_FILE", "capture_history.sqlite")),
+            crawler,
+            logger,
+            limit=settings.getint("PRODUCT_LIMIT", 0),
+            staleness_hours=settings.getfloat("SCHEDULE_STALENESS_HOURS", 168.0),
+            staleness_weight=settings.getfloat("SCHEDULE_STALENESS_WEIGHT", 1.0),
+            volatility_weight=settings.getfloat("SCHEDULE_VOLATILITY_WEIGHT", 1.0),
+            weights=settings.getdict("PRODUCT_WEIGHTS"),
+            change_selectors=settings.getlist("CHANGE_SELECTORS"),
+            budget=RunBudget(settings.getfloat("RUN_TIME_BUDGET", 0)),
+        )
+
+    def weight(self, url):
+        matches = [float(w) for pattern, w in self.weights.items() if pattern in url]
+        return max(matches) if matches else 1.0
+
+    def score(self, url, variant=None):
+        last, compared, changes = self.history.summary(url, variant)
+        staleness = 1.0 if last is None else min((time.time() - last) / 3600 / self.staleness_hours, 1.0)
+        volatility = (changes + 1) / (compared + 2)
+        return self.weight(url) * (self.staleness_weight * staleness + self.volatility_weight * volatility)
+
+    def plan(self, urls):
+        """The ``urls`` worth capturing this run, highest score first."""
+        scored = sorted(((self.score(url), url) for url in urls), key=lambda item: (-item[0], item[1]))
+        self.available = len(scored)
+        if self.limit:
+            scored = scored[:self.limit]
+        self.planned = {url: score for score, url in scored}
+        self.crawler.stats.set_value("schedule/available", self.available)
+        self.crawler.stats.set_value("schedule/planned", len(self.planned))
+        for score, url in scored:
+            self.logger.debug(f"Scheduled {url} (score {score:.3f})")
+        return [url for _, url in scored]
+
+    def priority(self, url):
+        """Scrapy request priority for a planned product (higher runs first)."""
+        return round(self.planned.get(url, 0) * 1000)
+
+    def lowest_priority(self):
+        """Priority of the least urgent planned product (0 when nothing is planned)."""
+        return min(map(self.priority, self.planned), default=0)
+
+    def order_variants(self, url, variants):
+        """``(index, variant)`` pairs, most likely changed first (stable for ties)."""
+        scores = [self.score(url, variant) for variant in variants]
+        return sorted(enumerate(variants), key=lambda item: -scores[item[0]])
+
+    async def fingerprint(self, page, data):
+        """Hash of the price/promo text on the page (``CHANGE_SELECTORS``), else of the screenshot."""
+        text = await page.evaluate(FINGERPRINT_SCRIPT, self.change_selectors) if self.change_selectors else ""
+        return hashlib.sha256(text.encode() if text else data).hexdigest()
+
+    async def record(self, page, data, url, region, variant, step):
+        if self.history.record(url, region, variant, step, await self.fingerprint(page, data)):
+            self.crawler.stats.inc_value("schedule/changed_captures")
+
+    def finished(self, url):
+        self.captured.add(url)
+
+    def report(self):
+        total = sum(self.planned.values())
+        covered = sum(self.planned.get(url, 0) for url in self.captured)
+        share = 100 * covered / total if total else 0
+        budget = f" of a {self.budget.seconds:.0f}s budget" if self.budget.seconds else ""
+        self.crawler.stats.set_value("schedule/captured", len(self.captured))
+        self.crawler.stats.set_value("schedule/score_coverage", round(share, 1))
+        self.logger.info(
+            f"Coverage: {len(self.captured)}/{len(self.planned)} planned products captured "
+            f"({len(self.planned)} of {self.available} available), {share:.0f}% of the planned priority "
+            f"score, in {self.budget.elapsed:.0f}s{budget}"
+        )
+        for url, score in sorted(self.planned.items(), key=lambda item: -item[1]):
+            if url not in self.captured:
+                self.logger.info(f"Not captured this run: {url} (score {score:.3f})")
+        self.history.close()
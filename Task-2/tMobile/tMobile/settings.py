@@ -46,6 +46,136 @@ PLAYWRIGHT_CONTEXTS = {
     }
 }
 
+# Regional captures: one browser context per profile in the shared browser.
+# Pick profiles at run time with `-a locales=us-west,us-east` (or `all`, or a
+# path to a JSON file of profiles); output is split into T-Mobile US/<profile>/.
+LOCALE_PROFILES = {
+    "us-west": {
+        "geolocation": {"latitude": 37.7749, "longitude": -122.4194},  # San Francisco
+        "timezone": "America/Los_Angeles",
+        "language": "en-US",
+    },
+    "us-central": {
+        "geolocation": {"latitude": 41.8781, "longitude": -87.6298},  # Chicago
+        "timezone": "America/Chicago",
+        "language": "en-US",
+    },
+    "us-east": {
+        "geolocation": {"latitude": 40.7128, "longitude": -74.0060},  # New York
+        "timezone": "America/New_York",
+        "language": "en-US",
+    },
+}
+LOCALES = []
+# Optional: name of the site cookie that carries a profile's "postcode" (ZIP) into
+# its context. The shipped profiles carry no ZIP, since the cookie is not known;
+# add both to pin a region to a delivery area.
+LOCALE_POSTCODE_COOKIE = None
+LOCALE_COOKIE_DOMAIN = ".t-mobile.com"
+
+# Where screenshots go: "folder" writes loose PNGs per product (default),
+# "archive" appends them to rolling tar segments in ARCHIVE_DIR with a
+# manifest.sqlite index. Export an archive back to folders with
+# `python -m tMobile.storage archive export <dir>`.
+SCREENSHOT_STORE = "folder"
+ARCHIVE_DIR = "archive"
+ARCHIVE_SEGMENT_BYTES = 512 * 1024 * 1024
+
+# On-demand profiling: selected products get a Playwright trace, a cProfile of
+# their callback and a summary.txt in <product folder>/_profile/. Select by
+# sample rate and/or URL substrings, e.g. `-s PROFILE_URLS=iphone-15`.
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_URLS = []
+PROFILE_TOP = 15
+
+# Render-stability capture mode: freeze CSS animations/transitions, pause
+# carousels and video, emulate reduced motion, and screenshot once the layout
+# has been quiet for RENDER_STABILITY_QUIET_MS instead of after fixed sleeps.
+RENDER_STABILITY = False
+RENDER_STABILITY_QUIET_MS = 750
+RENDER_STABILITY_TIMEOUT_MS = 5000
+
+# Disk cache for static assets (scripts, styles, fonts, images) shared by all
+# browser contexts and runs; honours Cache-Control/Expires, revalidates with
+# ETag/Last-Modified and evicts least recently used entries past the size cap.
+ASSET_CACHE_ENABLED = True
+ASSET_CACHE_DIR = ".asset_cache"
+ASSET_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Banners and modals clicked away by a page init script as soon as they appear,
+# at any point in the flow (counted under overlays/dismissed/<name>).
+OVERLAYS = [
+    {"name": "cookies", "selector": "#onetrust-accept-btn-handler"},
+    {"name": "compare", "selector": "[data-testid='_15gifts-engagement-bubble-button-secondary']"},
+    {"name": "notifications", "selector": ".op-block-class"},
+]
+
+# Time budgets for the product spider (seconds, 0 = unbounded). A product that
+# runs past PRODUCT_TIME_BUDGET is cancelled, keeps the screenshots taken so far,
+# releases its page and context, and is re-queued at lower priority.
+PRODUCT_TIME_BUDGET = 300
+RUN_TIME_BUDGET = 0
+PRODUCT_TIMEOUT_REQUEUE_TIMES = 1
+PRODUCT_TIMEOUT_PRIORITY_ADJUST = -10
+
+# Volatile regions (countdowns, chat bubbles, rotating banners) whose boxes are
+# recorded with each capture and blanked out by the post-processing job:
+# `python -m tMobile.postprocess "T-Mobile US" --workers 4`.
+MASK_REGIONS = [
+    {"name": "chat", "selector": "[id^='LPMcontainer'], .LPMcontainer"},
+    {"name": "countdown", "selector": "[class*='countdown'], [class*='Countdown']"},
+    {"name": "engagement", "selector": "[id^='_15gifts']"},
+]
+
+# Partitioned listing crawl (`scrapy crawl tmobile_listing -a partitions=config|discover`).
+# "config" renders the listing URLs below in parallel; "discover" loads the
+# first listing page and follows links matching LISTING_PARTITION_SELECTORS.
+LISTING_PARTITIONS = [
+    # "https://www.t-mobile.com/cell-phones/brand/apple",
+    # "https://www.t-mobile.com/cell-phones/brand/samsung",
+    # "https://www.t-mobile.com/cell-phones/brand/google",
+]
+LISTING_PARTITION_SELECTORS = [
+    "a[href*='/cell-phones/brand/']",
+    "a[rel='next']",
+    "a[href*='page=']",
+]
+LISTING_PARTITION_CONCURRENCY = 4
+
+# Product URL canonicalization and the persistent dedupe index shared by the
+# listing, partition, sitemap and product spiders. Product URLs are reduced to
+# https://www.t-mobile.com/cell-phone/{model}: query strings (sku, tracking),
+# fragments, trailing slashes and deeper path segments are dropped. Redirects
+# seen by the product spider are recorded as aliases.
+PRODUCT_INDEX_FILE = "product_index.sqlite"
+CANONICAL_BASE_URL = "https://www.t-mobile.com"
+CANONICAL_PATH_DEPTH = 2
+CANONICAL_KEEP_PARAMS = []
+# Regexes stripped from the model slug, e.g. storage or colour suffixes
+CANONICAL_PATH_SUFFIXES = [
+    r"-\d+(gb|tb)$",
+]
+
+# Capture scheduling: products (and their variants) are captured in order of
+# weight * (staleness + volatility). Staleness saturates after
+# SCHEDULE_STALENESS_HOURS since the last capture; volatility is how often the
+# price/promo text in CHANGE_SELECTORS (or the screenshot, if none match)
+# changed between past captures, kept in CAPTURE_HISTORY_FILE. PRODUCT_WEIGHTS
+# maps URL substrings to business weights. PRODUCT_LIMIT caps a run (0 = all).
+CAPTURE_HISTORY_FILE = "capture_history.sqlite"
+PRODUCT_LIMIT = 1  # first product only while testing
+SCHEDULE_STALENESS_HOURS = 168
+SCHEDULE_STALENESS_WEIGHT = 1.0
+SCHEDULE_VOLATILITY_WEIGHT = 1.0
+PRODUCT_WEIGHTS = {
+    # "apple-iphone": 2.0,
+}
+CHANGE_SELECTORS = [
+    "[class*='price']",
+    "[class*='Price']",
+    ".upf-productCard__promo--action",
+]
+
 # Concurrency and throttling settings
 #CONCURRENT_REQUESTS = 16
 CONCURRENT_REQUESTS_PER_DOMAIN = 1
@@ -71,9 +201,24 @@ DOWNLOAD_DELAY = 1
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "tMobile.middlewares.TmobileDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    "tMobile.middlewares.PlaywrightRoutingMiddleware": 543,
+}
+
+# Playwright requests are tried over plain HTTP first and escalated to the
+# browser when the response fails these checks (or lacks the request's
+# `routing_selectors`). Set `playwright_required` in meta to skip the probe.
+ROUTING_ENABLED = True
+ROUTING_CHALLENGE_MARKERS = [
+    "captcha",
+    "_incapsula_resource",
+    "cf-challenge",
+    "px-captcha",
+    "are you a robot",
+]
+ROUTING_PATTERN_DEPTH = 1  # URL path segments that make up a routing pattern
+ROUTING_DECISIONS_FILE = "routing_decisions.json"
+ROUTING_REPROBE_HOURS = 24  # "browser" decisions older than this are probed again (0 = never)
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
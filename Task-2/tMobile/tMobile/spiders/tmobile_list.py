@@ -1,96 +1,205 @@
 import scrapy
 from scrapy_playwright.page import PageMethod
 import csv
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 
+from tMobile.canonical import ProductIndex
 
-class TMobileListingSpider(scrapy.Spider):
-    name = "tmobile_listing"
-    start_urls = ["https://www.t-mobile.com/cell-phones"]
 
-    def start_requests(self):
-        custom_headers = {
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/116.0 Safari/537.36"
-            ),
-            "Accept-Language": "en-US,en;q=0.9",
-        }
-        for url in self.start_urls:
-            yield scrapy.Request(
-                url,
-                headers=custom_headers,
-                meta={
-                    "playwright": True,
-                    "playwright_page_methods": [
-                        PageMethod("wait_for_load_state", "domcontentloaded"),
-
-                        # Accept cookie banner if present
-                        PageMethod(
-                            "evaluate",
-                            """() => {
-                                const btn = document.querySelector("#onetrust-accept-btn-handler");
-                                if (btn) btn.click();
-                            }"""
-                        ),
-
-                        # Expand viewport
-                        PageMethod("set_viewport_size", {"width": 1280, "height": 2000}),
-
-                        # Infinite scroll until no new items
-                        PageMethod(
-                            "evaluate",
-                            """() => {
-                                const delay = ms => new Promise(res => setTimeout(res, ms));
-                                return (async () => {
-                                    let prevCount = 0;
-                                    let sameCount = 0;
-                                    while (sameCount < 3) {
-                                        window.scrollBy(0, window.innerHeight);
-                                        await delay(2000);
-                                        let items = document.querySelectorAll("a[itemprop='url']").length;
-                                        if (items === prevCount) {
-                                            sameCount++;
-                                        } else {
-                                            prevCount = items;
-                                            sameCount = 0;
-                                        }
-                                    }
-                                })();
-                            }"""
-                        ),
-                        PageMethod("wait_for_timeout", 2000),
-                    ],
-                },
-            )
+BASE_URL = "https://www.t-mobile.com"
+PRODUCT_PATH = "/cell-phone/"
+SCROLL_TO_END = """() => {
+        const delay = ms => new Promise(res => setTimeout(res, ms));
+        return (async () => {
+            let prevCount = 0;
+            let sameCount = 0;
+            while (sameCount < 3) {
+                window.scrollBy(0, window.innerHeight);
+                await delay(2000);
+                let items = document.querySelectorAll("a[itemprop='url']").length;
+                if (items === prevCount) {
+                    sameCount++;
+                } else {
+                    prevCount = items;
+                    sameCount = 0;
+                }
+            }
+        })();
+    }"""
+PRODUCT_URLS_CSV = "tmobile_product_urls.csv"
 
-    async def parse(self, response):
 
-        base = "https://www.t-mobile.com"
+def is_product_url(url):
+    """Phone product pages live under /cell-phone/{model} on t-mobile.com"""
+    parsed = urlparse(urljoin(BASE_URL, url))
+    return parsed.netloc.endswith("t-mobile.com") and parsed.path.startswith(PRODUCT_PATH)
 
-        # Extract product URLs
-        raw_hrefs = response.css("a[itemprop='url']::attr(href)").getall()
 
-        product_urls = set()
-        for href in raw_hrefs:
-            if not href:
-                continue
-            if href.startswith("/cell-phone/"):
-                full = urljoin(base, href)
-                product_urls.add(full)
+def extract_product_urls(response):
+    """Absolute product URLs linked from a rendered listing page"""
+    raw_hrefs = response.css("a[itemprop='url']::attr(href)").getall()
+    return {urljoin(BASE_URL, href) for href in raw_hrefs if href and is_product_url(href)}
 
-        product_list = sorted(product_urls)
 
-        # Save to CSV
-        with open("tmobile_product_urls.csv", "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
+def write_product_urls(urls, lastmods=None, path=PRODUCT_URLS_CSV):
+    """Save sorted product URLs (plus their sitemap lastmod, if known) to CSV"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if lastmods is None:
             writer.writerow(["url"])
-            for u in product_list:
+            for u in sorted(urls):
                 writer.writerow([u])
+        else:
+            writer.writerow(["url", "lastmod"])
+            for u in sorted(urls):
+                writer.writerow([u, lastmods.get(u) or ""])
+
+
+def listing_request(url, callback=None, scroll=True):
+    """Browser-rendered listing request; scrolls until no new products load unless ``scroll`` is off"""
+    custom_headers = {
+        "User-Agent": (
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+            "AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/116.0 Safari/537.36"
+        ),
+        "Accept-Language": "en-US,en;q=0.9",
+    }
+    page_methods = [
+        PageMethod("wait_for_load_state", "domcontentloaded"),
 
-        self.log(f"Found {len(product_list)} product URLs (saved to tmobile_product_urls.csv)")
+        # Accept cookie banner if present
+        PageMethod(
+            "evaluate",
+            """() => {
+                const btn = document.querySelector("#onetrust-accept-btn-handler");
+                if (btn) btn.click();
+            }"""
+        ),
+
+        # Expand viewport
+        PageMethod("set_viewport_size", {"width": 1280, "height": 2000}),
+    ]
+    if scroll:
+        # Infinite scroll until no new items
+        page_methods += [
+            PageMethod("evaluate", SCROLL_TO_END),
+            PageMethod("wait_for_timeout", 2000),
+        ]
+
+    return scrapy.Request(
+        url,
+        headers=custom_headers,
+        callback=callback,
+        meta={
+            "playwright": True,
+            # Scrolling loads the rest of the catalogue, which plain HTTP can't do
+            "playwright_required": scroll,
+            # Without scrolling, served over plain HTTP when the static HTML has product links
+            "routing_selectors": ["a[itemprop='url']"],
+            "playwright_page_methods": page_methods,
+        },
+    )
+
+
+def partition_urls(response, selectors):
+    """Same-site listing URLs (brand facets, further pages) linked from ``selectors``"""
+    host = urlparse(response.url).netloc
+    found = set()
+    for selector in selectors:
+        for href in response.css(f"{selector}::attr(href)").getall():
+            url = urljoin(response.url, href).split("#")[0]
+            if urlparse(url).netloc == host and url != response.url and not is_product_url(url):
+                found.add(url)
+    return found
+
+
+class TMobileListingSpider(scrapy.Spider):
+    """Collect product URLs from the rendered listing into the product CSV.
+
+    By default the whole catalogue is one page scrolled to the end. With
+    `-a partitions=config` the listing URLs in LISTING_PARTITIONS are rendered
+    in parallel instead; `-a partitions=discover` loads the first page without
+    scrolling and follows the brand/pagination links matched by
+    LISTING_PARTITION_SELECTORS. Partition results are merged and deduped
+    by canonical URL through the shared product index.
+    """
+
+    name = "tmobile_listing"
+    start_urls = ["https://www.t-mobile.com/cell-phones"]
+    partitions = None  # -a partitions=config|discover
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.index = ProductIndex.from_crawler(crawler)
+        if spider.partitions:
+            # Partitions share one domain, so let them render side by side
+            crawler.settings.set(
+                "CONCURRENT_REQUESTS_PER_DOMAIN",
+                crawler.settings.getint("LISTING_PARTITION_CONCURRENCY", 4),
+                priority="spider",
+            )
+        return spider
+
+    def start_requests(self):
+        if self.partitions == "config":
+            partitions = self.settings.getlist("LISTING_PARTITIONS")
+            if not partitions:
+                self.logger.warning("LISTING_PARTITIONS is empty, rendering the full listing instead")
+                partitions = self.start_urls
+            for url in partitions:
+                yield listing_request(url, callback=self.parse)
+        elif self.partitions == "discover":
+            for url in self.start_urls:
+                yield listing_request(url, callback=self.parse_partitions, scroll=False)
+        elif self.partitions:
+            raise ValueError(f"Unknown partitions mode {self.partitions!r}, expected 'config' or 'discover'")
+        else:
+            for url in self.start_urls:
+                yield listing_request(url)
+
+    def parse_partitions(self, response):
+        """Keep the page's products and fan out to the partitions it links to.
+
+        Partition pages are parsed the same way, so pagination inside a brand
+        is followed too; the dupefilter stops pages being rendered twice.
+        """
+        yield from self.parse(response)
+
+        partitions = partition_urls(response, self.settings.getlist("LISTING_PARTITION_SELECTORS"))
+        is_root = not response.meta.get("listing_partition")
+        if is_root:
+            self.logger.info(f"Discovered {len(partitions)} listing partitions on {response.url}")
+            if not partitions:
+                self.logger.warning("No partitions found, rendering the full listing instead")
+                yield listing_request(response.url, callback=self.parse).replace(dont_filter=True)
+                return
+        for url in sorted(partitions):
+            request = listing_request(url, callback=self.parse_partitions)
+            request.meta["listing_partition"] = True
+            yield request
+
+    def parse(self, response):
+        # Target only phone product links, one entry per canonical product
+        found = extract_product_urls(response)
+        new_urls = []
+        for url in sorted(found):
+            canonical, new = self.index.add(url)
+            if new:
+                new_urls.append(canonical)
+        self.logger.info(f"{len(found)} product URLs on {response.url} ({len(new_urls)} new)")
 
         # Also yield for debugging
-        for u in product_list:
+        for u in new_urls:
             yield {"url": u}
+
+    def closed(self, reason):
+        product_urls = list(self.index.found())
+        self.index.close()
+        if not product_urls:
+            # Keep the previous CSV rather than replacing it with an empty one
+            self.logger.warning(f"No product URLs found, {PRODUCT_URLS_CSV} left unchanged")
+            return
+        write_product_urls(product_urls)
+        self.log(f"Found {len(product_urls)} product URLs (saved to {PRODUCT_URLS_CSV})")
@@ -2,12 +2,32 @@ import scrapy
 import csv
 import os
 import re
+from functools import partial
 from urllib.parse import urlparse
 from scrapy_playwright.page import PageMethod
 
+from tMobile.asset_cache import AssetCache
+from tMobile.batch import ActionBatch
+from tMobile.canonical import ProductIndex
+from tMobile.deadlines import DeadlineScheduler, ProductProgress, ProductTimedOut
+from tMobile.locales import accept_language, load_profiles, request_meta, widen_concurrency
+from tMobile.overlays import OverlayDismisser
+from tMobile.postprocess import RegionRecorder
+from tMobile.profiling import Profiler
+from tMobile.scheduling import CaptureScheduler
+from tMobile.stability import RenderStabilizer
+from tMobile.storage import open_store
+
+
+COLOR_INPUTS = ".upf-skuSelector__group--color input[type=radio]"
+STORAGE_INPUTS = ".upf-skuSelector__group--storage input[type=radio]"
+CONTINUE_CTA = "button[data-selector='configurator-cta']"
+PROMO_DETAILS = "button.upf-productPromoDetails__card--btn"
+
 
 class TMobileProductSpider(scrapy.Spider):
     name = "tmobile_products"
+    locales = None  # -a locales=us-west,us-east
 
     custom_settings = {
         "PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT": 60000,
@@ -15,58 +35,150 @@ class TMobileProductSpider(scrapy.Spider):
         "PLAYWRIGHT_MAX_PAGES_PER_CONTEXT": 1,
     }
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.profiles = load_profiles(crawler.settings, spider.locales)
+        spider.store = open_store(crawler.settings)
+        spider.index = ProductIndex.from_crawler(crawler)
+        spider.work_list = set()
+        spider.scheduler = CaptureScheduler.from_crawler(crawler, spider.logger)
+        spider.profiler = Profiler.from_settings(crawler.settings)
+        spider.stabilizer = RenderStabilizer.from_settings(crawler.settings)
+        spider.asset_cache = AssetCache.from_crawler(crawler)
+        spider.overlays = OverlayDismisser.from_crawler(crawler)
+        spider.regions = RegionRecorder.from_settings(crawler.settings)
+        spider.deadlines = DeadlineScheduler.from_crawler(crawler, spider.logger, spider.scheduler.budget)
+        # One page per context, one context per region → regions run side by side
+        widen_concurrency(crawler.settings, len(spider.profiles))
+        return spider
+
     def start_requests(self):
         # Load product URLs from CSV
         with open("tmobile_product_urls.csv", newline="", encoding="utf-8") as f:
             reader = csv.DictReader(f)
             urls = [row["url"] for row in reader]
 
-        for url in urls[:1]:  # limit to first product for testing
-            yield scrapy.Request(
-                url,
-                meta=dict(
-                    playwright=True,
-                    playwright_include_page=True,  # gives access to playwright_page
-                    playwright_page_methods=[
-                        PageMethod("wait_for_load_state", "domcontentloaded"),
-                        PageMethod("set_viewport_size", {"width": 1280, "height": 2000}),
-                    ],
-                ),
-                callback=self.parse_product,
-            )
-
-    async def parse_product(self, response):
-        page = response.meta["playwright_page"]
+        # One flow per canonical product, however the CSV spells its URL
+        urls = list(dict.fromkeys(self.index.resolve(url) for url in urls))
+        # Products most likely to have changed first, up to PRODUCT_LIMIT
+        urls = self.scheduler.plan(urls)
+        self.work_list = set(urls)
+
+        regions = list(self.profiles.items()) or [(None, None)]
+        for url in urls:
+            for region, profile in regions:
+                yield self.product_request(url, region, profile)
+
+    def product_request(self, url, region=None, profile=None):
+        meta = dict(
+            playwright=True,
+            playwright_include_page=True,  # gives access to playwright_page
+            playwright_page_methods=[
+                PageMethod("wait_for_load_state", "domcontentloaded"),
+                PageMethod("set_viewport_size", {"width": 1280, "height": 2000}),
+            ],
+        )
+        headers = None
+        if region:
+            meta.update(request_meta(region, profile, self.settings))
+            if accept_language(profile):
+                headers = {"Accept-Language": accept_language(profile)}
+        else:
+            # A context closed after a timeout is recreated from these, not PLAYWRIGHT_CONTEXTS
+            meta["playwright_context_kwargs"] = self.settings.getdict("PLAYWRIGHT_CONTEXTS").get("default", {})
+
+        if self.profiler.select(url):
+            meta.update(self.profiler.request_meta(url, meta))
+        if self.overlays or self.stabilizer.enabled or self.asset_cache or meta.get("profile_session"):
+            meta["playwright_page_init_callback"] = self.init_page
+
+        # Each region fetches the same URL, so don't let the dupefilter drop them
+        return scrapy.Request(
+            url,
+            headers=headers,
+            meta=meta,
+            callback=self.parse_product,
+            priority=self.scheduler.priority(url),
+            dont_filter=bool(region),
+        )
 
-        # --- Helpers ---
-        async def safe_click(sel):
-            """Click element if it exists, ignore if missing."""
-            try:
-                el = await page.query_selector(sel)
-                if el:
-                    await el.click(timeout=1000)
-                    await page.wait_for_timeout(500)
-                    return True
-            except Exception:
-                return False
+    async def capture(self, page, progress, path, variant, step):
+        """Full-page screenshot into the configured store."""
+        progress.enter(f"{step}:{variant}" if variant else step)
+        regions = await self.regions.measure(page) if self.regions else None
+        data = await page.screenshot(full_page=True, **self.stabilizer.screenshot_kwargs())
+        self.store.save(path, data, product=progress.product, variant=variant, step=step, regions=regions)
+        await self.scheduler.record(page, data, progress.url, progress.region, variant, step)
+        progress.captured.append(path)
+        return path
+
+    def is_redirected_duplicate(self, response):
+        """Record a redirect to another canonical URL; True if that product is already in this run's work list."""
+        requested = self.index.canonicalizer.canonical(response.request.url)
+        target = self.index.add_alias(response.request.url, response.url)
+        if target == requested:
             return False
+        self.logger.info(f"{response.request.url} redirects to {response.url}")
+        if target in self.work_list:
+            self.crawler.stats.inc_value("dedupe/redirect_skipped")
+            self.logger.info(f"Skipping {response.request.url}: {target} is already being captured")
+            return True
+        return False
+
+    async def init_page(self, page, request):
+        """Runs before the first navigation of a page"""
+        if self.overlays:
+            await self.overlays.install(page)
+        await self.stabilizer.install(page)
+        if self.asset_cache:
+            await self.asset_cache.install(page)
+        if request.meta.get("profile_session"):
+            await self.profiler.start_page(page, request)
 
-        async def force_click(sel):
-            """Try normal click, fallback to JS click (bypasses overlays)."""
-            try:
-                await page.click(sel, timeout=1000)
-            except Exception:
-                await page.evaluate(f"""
-                    const el = document.querySelector("{sel}");
-                    if (el) el.click();
-                """)
-
-        # --- Handle random popups gracefully ---
-        await safe_click("#onetrust-accept-btn-handler")   # Cookies
-        await safe_click("[data-testid='_15gifts-engagement-bubble-button-secondary']")  # Compare popup
-        await safe_click(".op-block-class")  # Notifications
+    async def parse_product(self, response):
+        page = response.meta["playwright_page"]
+        if self.scheduler.budget.exhausted():
+            await page.close()
+            self.crawler.engine.close_spider(self, "run_budget_exceeded")
+            return
+        if self.is_redirected_duplicate(response):
+            await page.close()
+            return
+
+        progress = ProductProgress(response.request.url, response.meta.get("locale_region"))
+        capture_product = partial(self.capture_product, progress=progress)
+        session = response.meta.get("profile_session")
+        if session:
+            work = self.profiler.run(session, capture_product, response)
+        else:
+            work = capture_product(response)
+
+        completed = False
+        try:
+            await self.deadlines.run(progress, work, spent=response.meta.get("download_latency", 0))
+            completed = True
+        except ProductTimedOut:
+            region = response.meta.get("locale_region")
+            retry = self.deadlines.requeue(
+                response.request,
+                self.product_request(response.request.url, region, self.profiles.get(region)),
+                floor=self.scheduler.lowest_priority(),
+            )
+            return [retry] if retry else None
+        finally:
+            # However the flow ended, free the context's only page slot; screenshots taken so far are kept
+            if completed:
+                await page.close()
+            else:
+                await page.context.close()
+        self.scheduler.finished(response.request.url)
+
+    async def capture_product(self, response, progress):
+        page = response.meta["playwright_page"]
 
         # --- Get product title ---
+        progress.enter("title")
         # --- Extract brand from URL ---
         url_path = urlparse(response.url).path  # /cell-phone/apple-iphone-14
         parts = url_path.strip("/").split("/")
@@ -87,102 +199,96 @@ class TMobileProductSpider(scrapy.Spider):
         safe_name = re.sub(r"[^a-zA-Z0-9]+", "_", full_name).strip("_")
 
         # --- Base dir ---
-        base_dir = os.path.join("T-Mobile US", folder_title)
-        os.makedirs(base_dir, exist_ok=True)
+        base_dir = os.path.join("T-Mobile US", response.meta.get("locale_region") or "", folder_title)
+        response.meta["screenshot_path"] = base_dir
+        progress.product = folder_title
 
-        # --- Find best color (with max variants) ---
-        colors = await page.eval_on_selector_all(
-            ".upf-skuSelector__group--color input[type=radio]",
-            "els => els.map(e => e.value)"
-        )
+        # --- Find best color (with max variants), probing every color in one round trip ---
+        progress.enter("colors")
+        colors = (await ActionBatch().values(COLOR_INPUTS, name="colors", keep="colors").run(page))["colors"]
+
+        probe = ActionBatch()
+        for i in range(len(colors)):
+            probe.click(COLOR_INPUTS, ref=("colors", i), index=i).wait(2000).values(STORAGE_INPUTS, name=f"variants{i}")
+        counts = await probe.run(page) if colors else {}
 
         best_color = None
         max_variants = 0
-        for color in colors:
-            await force_click(f"input[value='{color}']")
-            await page.wait_for_timeout(2000)
-
-            variants = await page.eval_on_selector_all(
-                ".upf-skuSelector__group--storage input[type=radio]",
-                "els => els.map(e => e.value)"
-            )
-            if len(variants) > max_variants:
-                best_color = color
-                max_variants = len(variants)
-
-        if best_color:
-            await force_click(f"input[value='{best_color}']")
-            await page.wait_for_timeout(500)
-
-        # --- Screenshot each variant (always take at least one) ---
-        variants = await page.eval_on_selector_all(
-            ".upf-skuSelector__group--storage input[type=radio]",
-            "els => els.map(e => e.value)"
-        )
-
-        for var in variants:
-            await force_click(f"input[value='{var}']")
-            await page.wait_for_timeout(2000)
-
-            clean_variant = re.sub(r"[^a-zA-Z0-9]+", "_", var).strip("_")
+        for i in range(len(colors)):
+            if len(counts[f"variants{i}"]) > max_variants:
+                best_color = i
+                max_variants = len(counts[f"variants{i}"])
+
+        # --- Select it and read its variants ---
+        select = ActionBatch()
+        if best_color is not None:
+            select.click(COLOR_INPUTS, ref=("colors", best_color), index=best_color).wait(500)
+        variants = (await select.values(STORAGE_INPUTS, name="variants", keep="variants").run(page))["variants"]
+
+        # --- Screenshot each variant (always take at least one), most likely changed first ---
+        clean_variants = [re.sub(r"[^a-zA-Z0-9]+", "_", var).strip("_") for var in variants]
+        for i, clean_variant in self.scheduler.order_variants(progress.url, clean_variants):
+            var = variants[i]
+            progress.enter(f"select:{var}")
+            await ActionBatch().click(STORAGE_INPUTS, ref=("variants", i), index=i).run(page)
+            await self.stabilizer.settle(page, 2000)
 
             # --- Always save base variant screenshot ---
             variant_file = os.path.join(base_dir, f"{folder_title}_{clean_variant}.png")
-            await page.screenshot(path=variant_file, full_page=True)
+            await self.capture(page, progress, variant_file, clean_variant, "variant")
             self.logger.info(f"Variant screenshot saved: {variant_file}")
 
             # --- Optional: Airtime flow if continue button exists ---
-            continue_btn = await page.query_selector("button[data-selector='configurator-cta']")
-            if continue_btn:
-                await continue_btn.click()
+            if (await ActionBatch().click(CONTINUE_CTA, name="continue").run(page))["continue"]:
                 await page.wait_for_load_state("domcontentloaded")
-                await page.wait_for_timeout(3000)
+                await self.stabilizer.settle(page, 3000)
 
                 airtime_file = os.path.join(base_dir, f"{folder_title}_{clean_variant}_airtime.png")
-                await page.screenshot(path=airtime_file, full_page=True)
+                await self.capture(page, progress, airtime_file, clean_variant, "airtime")
                 self.logger.info(f"Airtime screenshot saved: {airtime_file}")
 
         # --- Handle promotions (with Airtime flow) ---
-        promo_btn = await page.query_selector(".upf-productCard__promo--action")
-        if promo_btn:
-            await promo_btn.click()
-            await page.wait_for_timeout(3000)
+        progress.enter("promotions")
+        promo = await ActionBatch().click(".upf-productCard__promo--action", name="opened").run(page)
+        if promo["opened"]:
+            await self.stabilizer.settle(page, 3000)
             
             # --- Screenshot promo modal with all offers ---
             promo_file = os.path.join(base_dir, f"{folder_title}_offer_promo.png")
-            await page.screenshot(path=promo_file, full_page=True)
+            await self.capture(page, progress, promo_file, None, "offer_promo")
             self.logger.info(f"Promo list screenshot saved: {promo_file}")
 
-            details = await page.query_selector_all("button.upf-productPromoDetails__card--btn")
+            details = (await ActionBatch().texts(PROMO_DETAILS, name="details", keep="details").run(page))["details"]
             for i in range(len(details)):
-                details = await page.query_selector_all("button.upf-productPromoDetails__card--btn")
-                btn = details[i]
-                await btn.click()
-                await page.wait_for_timeout(2000)
+                # Kept buttons go stale once the modal re-renders; then the i-th match is clicked
+                await ActionBatch().click(PROMO_DETAILS, ref=("details", i), index=i, required=True).run(page)
+                await self.stabilizer.settle(page, 2000)
 
                 # --- Always screenshot the modal content ---
                 offer_file = os.path.join(base_dir, f"{folder_title}_offer{i+1}.png")
-                await page.screenshot(path=offer_file, full_page=True)
+                await self.capture(page, progress, offer_file, f"offer{i+1}", "offer")
                 self.logger.info(f"Promo modal screenshot saved: {offer_file}")
 
                 # --- Optional: Airtime flow if continue button exists ---
-                continue_btn = await page.query_selector("button[data-selector='configurator-cta']")
-                if continue_btn:
-                    await continue_btn.click()
+                if (await ActionBatch().click(CONTINUE_CTA, name="continue").run(page))["continue"]:
                     await page.wait_for_load_state("domcontentloaded")
-                    await page.wait_for_timeout(3000)
+                    await self.stabilizer.settle(page, 3000)
 
                     airtime_file = os.path.join(base_dir, f"{folder_title}_offer{i+1}_airtime.png")
-                    await page.screenshot(path=airtime_file, full_page=True)
+                    await self.capture(page, progress, airtime_file, f"offer{i+1}", "offer_airtime")
                     self.logger.info(f"Airtime promo screenshot saved: {airtime_file}")
 
-                # Go back (force click in case normal fails)
-                await force_click("button.upf-productPromoDetails__card--back")
-                await page.wait_for_timeout(1000)
+                # Go back (DOM click, not blocked by overlays)
+                await ActionBatch().click("button.upf-productPromoDetails__card--back").wait(1000).run(page)
 
             # Close promotions popup once after all offers
-            await force_click("button.phx-modal__close")
-            await page.wait_for_timeout(1000)
-
-        # --- Cleanup ---
-        await page.close()
+            progress.enter("close_promotions")
+            await ActionBatch().click("button.phx-modal__close").wait(1000).run(page)
+
+    def closed(self, reason):
+        self.store.close()
+        self.index.close()
+        if self.asset_cache:
+            self.asset_cache.close()
+        self.deadlines.report()
+        self.scheduler.report()
@@ -0,0 +1,94 @@
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.spiders import SitemapSpider
+
+from tMobile.canonical import ProductIndex
+from tMobile.spiders.tmobile_list import (
+    PRODUCT_URLS_CSV,
+    TMobileListingSpider,
+    extract_product_urls,
+    is_product_url,
+    listing_request,
+    write_product_urls,
+)
+
+
+class TMobileSitemapSpider(SitemapSpider):
+    """Discover product URLs from robots.txt / sitemap indexes over plain HTTP.
+
+    Nested and gzipped sitemaps are followed without a browser; product
+    entries are filtered with the listing spider's URL rule, deduped by
+    canonical URL and recorded with their lastmod instead of being
+    downloaded. The browser listing only runs when the sitemaps yield no
+    products, or always with `-a crosscheck=1` to report coverage differences.
+    """
+
+    name = "tmobile_sitemap"
+    sitemap_urls = ["https://www.t-mobile.com/robots.txt"]
+    crosscheck = False
+
+    custom_settings = {
+        # No startup contexts: the browser is only launched if the listing fallback runs
+        "PLAYWRIGHT_CONTEXTS": {},
+    }
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.index = ProductIndex.from_crawler(crawler)
+        spider.lastmods = {}
+        spider.listed_urls = None
+        spider.crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        return spider
+
+    def sitemap_filter(self, entries):
+        if entries.type != "urlset":
+            # Sitemap index: follow every nested sitemap
+            yield from entries
+            return
+
+        for entry in entries:
+            loc = entry.get("loc", "")
+            if is_product_url(loc):
+                canonical, new = self.index.add(loc)
+                lastmod = entry.get("lastmod")
+                if new or (lastmod or "") > (self.lastmods.get(canonical) or ""):
+                    self.lastmods[canonical] = lastmod
+        # Product pages themselves are not fetched
+
+    def spider_idle(self):
+        if self.listed_urls is not None:
+            return
+        if self.lastmods and str(self.crosscheck).lower() not in ("1", "true", "yes"):
+            return
+
+        if not self.lastmods:
+            self.logger.warning("No products found in sitemaps, falling back to the browser listing")
+        self.listed_urls = set()
+        for url in TMobileListingSpider.start_urls:
+            self.crawler.engine.crawl(listing_request(url, callback=self.parse_listing))
+        raise DontCloseSpider
+
+    def parse_listing(self, response):
+        self.listed_urls.update(self.index.add(url)[0] for url in extract_product_urls(response))
+
+    def closed(self, reason):
+        self.index.close()
+        urls = set(self.lastmods) | (self.listed_urls or set())
+
+        if self.lastmods and self.listed_urls is not None:
+            sitemap_only = set(self.lastmods) - self.listed_urls
+            listing_only = self.listed_urls - set(self.lastmods)
+            self.logger.info(
+                f"Coverage: {len(urls)} products, {len(sitemap_only)} only in sitemaps, "
+                f"{len(listing_only)} only in the browser listing"
+            )
+            for u in sorted(listing_only):
+                self.logger.info(f"Missing from sitemaps: {u}")
+
+        if not urls:
+            # Keep the previous CSV rather than replacing it with an empty one
+            self.logger.warning(f"No product URLs found, {PRODUCT_URLS_CSV} left unchanged")
+            return
+        write_product_urls(urls, lastmods=self.lastmods)
+        self.logger.info(f"Found {len(urls)} product URLs (saved to {PRODUCT_URLS_CSV})")
@@ -0,0 +1,132 @@
+from playwright.async_api import Error as PlaywrightError
+
+
+FREEZE_SCRIPT = """(() => {
+    const css = `
+        *, *::before, *::after {
+            animation: none !important;
+            transition: none !important;
+            scroll-behavior: auto !important;
+            caret-color: transparent !important;
+        }`;
+    const freeze = () => {
+        if (!document.documentElement || document.getElementById("__render-freeze")) return;
+        const style = document.createElement("style");
+        style.id = "__render-freeze";
+        style.textContent = css;
+        (document.head || document.documentElement).appendChild(style);
+    };
+    const pause = () => {
+        document.querySelectorAll("video, audio").forEach(media => {
+            media.autoplay = false;
+            try { media.pause(); } catch (e) {}
+        });
+        document.querySelectorAll(".swiper, .swiper-container").forEach(el => {
+            if (el.swiper && el.swiper.autoplay) el.swiper.autoplay.stop();
+        });
+        if (window.jQuery && window.jQuery.fn.slick) {
+            window.jQuery(".slick-initialized").slick("slickPause");
+        }
+    };
+    if ("scrollRestoration" in history) history.scrollRestoration = "manual";
+    freeze();
+    document.addEventListener("DOMContentLoaded", () => {
+        freeze();
+        pause();
+        let queued = false;
+        new MutationObserver(() => {
+            if (queued) return;
+            queued = true;
+            requestAnimationFrame(() => { queued = false; pause(); });
+        }).observe(document.documentElement, { childList: true, subtree: true });
+    });
+})();"""
+
+WAIT_FOR_STABLE_LAYOUT = """async ([quietMs, timeoutMs]) => {
+    const start = performance.now();
+    let lastChange = start;
+    const touch = () => { lastChange = performance.now(); };
+
+    document.getAnimations().forEach(a => { try { a.finish(); } catch (e) {} });
+    window.scrollTo(0, 0);
+
+    const mutations = new MutationObserver(touch);
+    mutations.observe(document.documentElement, {
+        childList: true, subtree: true, attributes: true, characterData: true,
+    });
+    let shifts = null;
+    try {
+        shifts = new PerformanceObserver(touch);
+        shifts.observe({ type: "layout-shift", buffered: false });
+    } catch (e) {}
+
+    let height = document.documentElement.scrollHeight;
+    while (performance.now() - start < timeoutMs) {
+        await new Promise(res => requestAnimationFrame(() => setTimeout(res, 50)));
+        if (document.documentElement.scrollHeight !== height) {
+            height = document.documentElement.scrollHeight;
+            touch();
+        }
+        const imagesDone = Array.from(document.images).every(img => img.complete);
+        if (imagesDone && document.fonts.status === "loaded" && performance.now() - lastChange >= quietMs) break;
+    }
+
+    mutations.disconnect();
+    if (shifts) shifts.disconnect();
+    window.scrollTo(0, 0);
+    return Math.round(performance.now() - start);
+}"""
+
+
+class RenderStabilizer:
+    """Freeze animations, carousels and media so screenshots are deterministic.
+
+    When enabled, ``install`` adds an init script (no transitions/animations,
+    paused video and carousels, manual scroll restoration) and emulates
+    reduced motion; ``settle`` then waits for a layout-stability signal (no
+    DOM mutations, layout shifts or height changes for ``quiet_ms``, images
+    and fonts loaded) instead of a fixed sleep. Disabled, it keeps the
+    original fixed waits.
+    """
+
+    # A click may start a navigation after the caller's load-state wait returned
+    NAVIGATION_RETRIES = 2
+
+    def __init__(self, enabled=False, quiet_ms=750, timeout_ms=5000):
+        self.enabled = enabled
+        self.quiet_ms = quiet_ms
+        self.timeout_ms = timeout_ms
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            enabled=settings.getbool("RENDER_STABILITY", False),
+            quiet_ms=settings.getint("RENDER_STABILITY_QUIET_MS", 750),
+            timeout_ms=settings.getint("RENDER_STABILITY_TIMEOUT_MS", 5000),
+        )
+
+    async def install(self, page):
+        if not self.enabled:
+            return
+        await page.emulate_media(reduced_motion="reduce")
+        await page.add_init_script(FREEZE_SCRIPT)
+
+    async def settle(self, page, fallback_ms):
+        """Wait until the page is visually stable, or ``fallback_ms`` when disabled."""
+        if not self.enabled:
+            await page.wait_for_timeout(fallback_ms)
+            return
+        for attempt in range(self.NAVIGATION_RETRIES + 1):
+            try:
+                await page.evaluate(WAIT_FOR_STABLE_LAYOUT, [self.quiet_ms, self.timeout_ms])
+                return
+            except PlaywrightError as e:
+                if "Execution context was destroyed" not in str(e) or attempt == self.NAVIGATION_RETRIES:
+                    raise
+            # The document being watched went away: settle the one that replaced it
+            await page.wait_for_load_state("domcontentloaded")
+
+    def screenshot_kwargs(self):
+        if not self.enabled:
+            return {}
+        return {"animations": "disabled", "caret": "hide"}
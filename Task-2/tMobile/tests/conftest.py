@@ -0,0 +1,34 @@
+import pytest
+from scrapy import Spider
+from scrapy.crawler import Crawler
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    """Project settings, run from an empty working directory (CSV and state files go there)."""
+    monkeypatch.chdir(tmp_path)
+    settings = Settings()
+    settings.setmodule("tMobile.settings", priority="project")
+    return settings
+
+
+@pytest.fixture
+def make_spider(settings):
+    """Build a spider the way ``scrapy crawl`` does: before the crawler has its stats."""
+    def make(spidercls, **overrides):
+        settings.update(overrides, priority="cmdline")
+        crawler = Crawler(spidercls, settings)
+        spider = spidercls.from_crawler(crawler)
+        crawler.stats = MemoryStatsCollector(crawler)
+        return spider
+    return make
+
+
+@pytest.fixture
+def crawler(settings):
+    """A crawler with project settings and stats, for helpers built from one."""
+    crawler = Crawler(Spider, settings)
+    crawler.stats = MemoryStatsCollector(crawler)
+    return crawler
@@ -0,0 +1,89 @@
+import pytest
+
+from tMobile.canonical import Canonicalizer, ProductIndex
+
+
+BASE = "https://www.t-mobile.com/cell-phone"
+A = f"{BASE}/apple-iphone-15"
+B = f"{BASE}/apple-iphone-15-pro"
+C = f"{BASE}/apple-iphone-15-pro-max"
+
+
+@pytest.mark.parametrize("url, canonical", [
+    ("http://t-mobile.com/cell-phone/apple-iphone-15/", A),
+    (f"{BASE}/Apple-iPhone-15-256GB?sku=123&utm_source=mail#specs", A),
+    (f"{BASE}//apple-iphone-15/black", A),
+    ("https://WWW.T-MOBILE.COM:443/cell-phone/apple-iphone-15", A),
+    ("https://shop.example.com/Phone/", "https://shop.example.com/phone"),
+])
+def test_canonical_with_project_settings(settings, url, canonical):
+    assert Canonicalizer.from_settings(settings).canonical(url) == canonical
+
+
+def test_keep_params_survive_sorted():
+    canonicalizer = Canonicalizer("https://www.example.com", keep_params=["sku", "plan"])
+
+    assert canonicalizer.canonical("https://example.com/phone?utm_source=x&sku=2&plan=a") == (
+        "https://www.example.com/phone?plan=a&sku=2"
+    )
+
+
+def products(index):
+    return index.db.execute("SELECT url, first_seen, run FROM products ORDER BY url").fetchall()
+
+
+def test_add_counts_each_product_once_per_run(crawler):
+    index = ProductIndex.from_crawler(crawler)
+
+    assert index.add(A) == (A, True)
+    assert index.add(A + "/?utm_source=mail") == (A, False)
+    assert index.add(B) == (B, True)
+
+    assert list(index.found()) == [A, B]
+    assert crawler.stats.get_value("dedupe/unique") == 2
+    assert crawler.stats.get_value("dedupe/duplicates") == 1
+    index.close()
+
+
+def test_add_alias_moves_the_product_to_its_target(crawler):
+    index = ProductIndex.from_crawler(crawler)
+    index.add(A)
+
+    assert index.add_alias(A, B) == B
+
+    assert index.resolve(A) == B
+    assert [row[0] for row in products(index)] == [B]
+    # The old URL now counts as the product it redirects to
+    assert index.add(A) == (B, False)
+    assert list(index.found()) == [B]
+    index.close()
+
+
+def test_add_alias_follows_chains(crawler):
+    index = ProductIndex.from_crawler(crawler)
+    index.add_alias(A, B)
+    index.add_alias(B, C)
+
+    assert index.resolve(A) == C
+    assert index.resolve(B) == C
+    assert crawler.stats.get_value("dedupe/redirects") == 2
+    # Redirecting a URL to itself records nothing
+    assert index.add_alias(C, C + "/") == C
+    assert crawler.stats.get_value("dedupe/redirects") == 2
+    index.close()
+
+
+def test_add_alias_merges_history_across_runs(crawler):
+    earlier = ProductIndex.from_crawler(crawler)
+    earlier.add(A)
+    (first_seen,) = earlier.db.execute("SELECT first_seen FROM products").fetchone()
+    earlier.close()
+
+    index = ProductIndex.from_crawler(crawler)
+    index.add(B)
+    index.add_alias(A, B)
+
+    # One product left, first seen when the old URL was, and found in this run
+    assert products(index) == [(B, first_seen, index.run)]
+    index.close()
+
@@ -0,0 +1,45 @@
+import io
+
+from PIL import Image
+
+from tMobile.postprocess import process_folder, process_image
+from tMobile.storage import FolderStore, load_regions
+
+
+# A 200x200 white capture with a volatile block (masked) and a real one (kept)
+VOLATILE = {"name": "countdown", "x": 20, "y": 20, "width": 30, "height": 30}
+
+
+def capture():
+    image = Image.new("RGB", (200, 200), "white")
+    image.paste((0, 0, 0), (20, 20, 50, 50))
+    image.paste((200, 0, 0), (120, 130, 140, 150))
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_process_image_masks_then_trims():
+    image = Image.open(io.BytesIO(process_image(capture(), [VOLATILE], margin=5)))
+
+    # Only the kept block (20x20) plus the margin survives the trim
+    assert image.size == (30, 30)
+    assert image.getpixel((15, 15)) == (200, 0, 0)
+    assert image.getpixel((0, 0)) == (255, 255, 255)
+
+
+def test_process_image_without_regions_keeps_all_content():
+    image = Image.open(io.BytesIO(process_image(capture(), margin=0)))
+
+    assert image.size == (120, 130)
+    assert image.getpixel((0, 0)) == (0, 0, 0)
+
+
+def test_process_folder_uses_recorded_regions(tmp_path):
+    path = FolderStore(str(tmp_path)).save("product/variant.png", capture(), regions=[VOLATILE])
+
+    assert process_folder(str(tmp_path), workers=1, margin=5)[0] == 1
+    assert Image.open(path).size == (30, 30)
+    assert load_regions(str(tmp_path / "product"))["variant.png"]["processed"]
+    # Processed captures are left alone on the next run
+    assert process_folder(str(tmp_path), workers=1, margin=5)[0] == 0
@@ -0,0 +1,28 @@
+from tMobile.spiders.tmobile_products import TMobileProductSpider
+
+
+PRODUCT = "https://www.t-mobile.com/cell-phone/apple-iphone-15"
+
+
+def test_start_requests(tmp_path, make_spider):
+    (tmp_path / "tmobile_product_urls.csv").write_text(
+        f"url\n{PRODUCT}\n{PRODUCT}/?utm_source=mail\nhttps://www.t-mobile.com/cell-phone/apple-iphone-14\n",
+        encoding="utf-8",
+    )
+    spider = make_spider(TMobileProductSpider, PRODUCT_LIMIT=0, PRODUCT_WEIGHTS={"iphone-15": 2})
+
+    requests = list(spider.start_requests())
+
+    urls = list(dict.fromkeys(request.url for request in requests))
+    assert urls == [PRODUCT, "https://www.t-mobile.com/cell-phone/apple-iphone-14"]
+    assert all(request.priority == spider.scheduler.priority(request.url) > 0 for request in requests)
+    assert spider.crawler.stats.get_value("schedule/planned") == 2
+
+    # A timed-out product goes behind everything still planned
+    request = requests[0]
+    retry = spider.deadlines.requeue(
+        request, spider.product_request(request.url), floor=spider.scheduler.lowest_priority()
+    )
+    assert retry.priority < min(r.priority for r in requests)
+    assert spider.crawler.stats.get_value("deadline/requeued") == 1
+    assert spider.deadlines.budget is spider.scheduler.budget